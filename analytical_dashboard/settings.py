@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'dashboard.middleware.CompressionMiddleware',
+    'dashboard.middleware.WarmUpMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -112,6 +115,105 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static"),
 ]
 
+# Database aliases from DATABASES on which the departments are sharded, see
+# dashboard/sharding.py. Each department with its teams, users, objectives and
+# key results lives on one shard, e.g. with several local SQLite files:
+# DATABASES = {
+#     "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": "shard0.db"},
+#     "shard1": {"ENGINE": "django.db.backends.sqlite3", "NAME": "shard1.db"},
+# }
+# DASHBOARD_SHARDS = ["default", "shard1"]
+# Run `python manage.py migrate --database <alias>` for every shard, each one
+# is seeded with all the sample departments, then
+# `python manage.py rebalance_shards` to keep each department on its shard
+DASHBOARD_SHARDS = ["default"]
+
+DATABASE_ROUTERS = ['dashboard.routers.DepartmentShardRouter']
+
+# Stale-while-revalidate serving of the departments analysis, see
+# dashboard/cache.py. Use a shared cache backend in CACHES to coalesce the
+# recomputations across worker processes
+DASHBOARD_CACHE = {
+    "ENABLED": True,
+    "ALIAS": "default",
+    # Served as is
+    "FRESH_SECONDS": 60,
+    # Served while one background worker recomputes it
+    "STALE_SECONDS": 3600,
+}
+
+# Threads per gunicorn worker process, see gunicorn.conf.py
+SERVER_THREADS = int(os.environ.get("GUNICORN_THREADS", 16))
+
+# Live updates of the departments page over server-sent events, see
+# dashboard/live.py
+DASHBOARD_LIVE = {
+    # How often the broadcasters poll the metrics version in the database
+    "POLL_SECONDS": 2,
+    "HEARTBEAT_SECONDS": 15,
+    # Connected clients per process, more are refused with 503. Every client
+    # holds a server thread while it is connected, half of the threads are
+    # kept for the other requests
+    "MAX_SUBSCRIBERS": max(SERVER_THREADS // 2, 1),
+    # Events buffered per client before it is resynchronised with a snapshot
+    "QUEUE_SIZE": 10,
+}
+
+# Admission control of the dashboard endpoints, see dashboard/admission.py.
+# The limits are per worker process
+DASHBOARD_ADMISSION = {
+    "ENABLED": True,
+    "RETRY_AFTER_SECONDS": 5,
+    # A departments request costs one unit per started SPAN_DAYS_PER_UNIT
+    # days of its filters, times one per started ORG_SIZE_PER_UNIT objectives
+    "SPAN_DAYS_PER_UNIT": 90,
+    "ORG_SIZE_PER_UNIT": 100000,
+    "ENDPOINTS": {
+        "departments": {"CAPACITY": 8, "MAX_QUEUED": 16,
+                        "QUEUE_TIMEOUT_SECONDS": 10},
+        "teams": {"CAPACITY": 32, "MAX_QUEUED": 64,
+                  "QUEUE_TIMEOUT_SECONDS": 5},
+    },
+}
+
+# Cold-data archival of the key results, see dashboard/archive.py
+DASHBOARD_ARCHIVE = {
+    # Key results last updated more than this many days ago are archived
+    "HORIZON_DAYS": 730,
+    # Key results moved per transaction
+    "BATCH_SIZE": 1000,
+}
+
+# Migration to the compact schema, see dashboard/compact.py
+DASHBOARD_COMPACT_SCHEMA = {
+    # Aggregate on the key result status codes, enable once
+    # `python manage.py compact_schema` has filled them
+    "STATUS_CODE_READS": False,
+    # Rows updated per transaction by `compact_schema`
+    "BATCH_SIZE": 1000,
+}
+
+# Warm-up of the gunicorn workers before they accept connections, and of
+# other servers on their first request, see dashboard/warmup.py
+DASHBOARD_WARMUP = {
+    "ENABLED": True,
+    # Warm up in the background from the first request, e.g. under
+    # runserver. Not under gunicorn, which sets SERVER_SOFTWARE before it
+    # loads the app, nor while running the tests
+    "ON_FIRST_REQUEST": not os.environ.get("SERVER_SOFTWARE", "").startswith(
+                        "gunicorn") and sys.argv[1:2] != ["test"],
+    # Departments page filters precomputed besides the defaults
+    "FILTERS": [
+        {"on_track_filter": "2 weeks", "recently_upd_filter": "4 weeks"},
+        {"on_track_filter": "1 months", "recently_upd_filter": "3 months"},
+    ],
+    # Teams pages of the departments with the most users
+    "TEAMS_DEPARTMENTS": 5,
+    # Pages warmed by another worker within this many seconds are skipped,
+    # their results are in the shared cache
+    "CLAIM_SECONDS": 300,
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -1,3 +1,244 @@
-from django.contrib import admin
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Admin registration of the dashboard models
+#
+# The changelists are built to stay fast on tables with millions of rows
+# * the row count comes from the planner statistics(postgres) instead of an
+#   exact COUNT(*), small results are still counted exactly
+# * foreign keys are selected with the rows and edited with raw id widgets
+# * filters only use indexed columns and need no query to render
+# * bulk status changes are applied in batches of short transactions
+#
+# With department sharding every changelist has a shard filter, default the
+# first shard, and objects are read, edited and deleted on the selected
+# shard. New departments and teams are saved on their department's shard,
+# new users, objectives and key results on the shard of their related object
+from json import loads
 
-# Register your models here.
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.http import QueryDict
+from django.utils.functional import cached_property
+
+from .live import bump_metrics_version
+from .models import (Department, KeyResults, Objectives, Teams, Users,
+                     get_status_code)
+from .sharding import get_shards
+
+# Below this many estimated rows the exact count is cheap enough
+EXACT_COUNT_THRESHOLD = 10000
+# Key results updated per transaction by the bulk actions
+BULK_UPDATE_BATCH_SIZE = 1000
+SHARD_PARAM = "shard"
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which takes the count from the planner estimate on postgres
+    when the result is large
+    """
+
+    @cached_property
+    def count(self):
+        estimate = _get_estimated_count(self.object_list)
+        if estimate is not None and estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+
+def _get_estimated_count(queryset):
+    """
+    Function to get the planner's estimate of the no of rows of a queryset
+    Args:
+        queryset - queryset to count
+    Returns:
+        estimated no of rows, None when the backend can't estimate
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            # Unfiltered, the table statistics are enough
+            cursor.execute("SELECT reltuples::bigint FROM pg_class "
+                           "WHERE relname = %s",
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            if row is not None and row[0] > 0:
+                return int(row[0])
+            return None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class ShardFilter(admin.SimpleListFilter):
+    """
+    Changelist filter which selects the shard to browse
+    """
+    title = "shard"
+    parameter_name = SHARD_PARAM
+
+    def lookups(self, request, model_admin):
+        return [(using, using) for using in get_shards()]
+
+    def queryset(self, request, queryset):
+        # The queryset is already on the shard, see ScalableModelAdmin
+        return queryset
+
+    def choices(self, changelist):
+        selected = get_admin_shard(changelist.params)
+        for using, title in self.lookup_choices:
+            yield {
+                "selected": using == selected,
+                "query_string": changelist.get_query_string(
+                                {self.parameter_name: using}),
+                "display": title,
+            }
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered COUNT(*) of the changelist
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if len(get_shards()) > 1:
+            return (ShardFilter,) + tuple(list_filter)
+        return list_filter
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(
+               get_admin_shard(_get_shard_params(request)))
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Related objects are looked up on the same shard
+        kwargs.setdefault("using", get_admin_shard(_get_shard_params(request)))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+def get_admin_shard(params):
+    """
+    Function to get the shard selected in the admin
+    Args:
+        params - dict like request params
+    Returns:
+        database alias, the first shard when none or an unknown one is
+        selected
+    """
+    shards = get_shards()
+    shard = params.get(SHARD_PARAM)
+    return shard if shard in shards else shards[0]
+
+def _get_shard_params(request):
+    """
+    Function to get the params which carry the selected shard. The change
+    views get the changelist filters in `_changelist_filters`
+    Args:
+        request - HTTP request
+    Returns:
+        dict like params
+    """
+    if SHARD_PARAM in request.GET:
+        return request.GET
+    return QueryDict(request.GET.get("_changelist_filters", ""))
+
+
+@admin.register(Department)
+class DepartmentAdmin(ScalableModelAdmin):
+    list_display = ("department_id", "name", "location",
+                    "date_of_innaugration")
+    search_fields = ("name",)
+
+
+@admin.register(Teams)
+class TeamsAdmin(ScalableModelAdmin):
+    list_display = ("team_id", "department_id", "team_lead_id", "average_pay")
+    list_select_related = ("department_id", "team_lead_id")
+    raw_id_fields = ("department_id", "team_lead_id")
+    search_fields = ("=team_id",)
+
+
+@admin.register(Users)
+class UsersAdmin(ScalableModelAdmin):
+    list_display = ("user_id", "first_name", "last_name", "team_id")
+    list_select_related = ("team_id",)
+    raw_id_fields = ("team_id",)
+    search_fields = ("=user_id",)
+
+
+@admin.register(Objectives)
+class ObjectivesAdmin(ScalableModelAdmin):
+    list_display = ("objective_id", "objective_text", "user_id")
+    list_select_related = ("user_id",)
+    raw_id_fields = ("user_id",)
+    search_fields = ("=objective_id",)
+
+
+@admin.register(KeyResults)
+class KeyResultsAdmin(ScalableModelAdmin):
+    list_display = ("keyresult_id", "keyresult_text", "status", "due_date",
+                    "updated_date", "objective_id")
+    list_select_related = ("objective_id",)
+    list_filter = ("status", "updated_date")
+    raw_id_fields = ("objective_id",)
+    search_fields = ("=keyresult_id",)
+    actions = ("mark_complete", "mark_pending")
+
+    def mark_complete(self, request, queryset):
+        self._change_status(request, queryset, "Complete")
+    mark_complete.short_description = "Mark selected key results as complete"
+
+    def mark_pending(self, request, queryset):
+        self._change_status(request, queryset, "Pending")
+    mark_pending.short_description = "Mark selected key results as pending"
+
+    def _change_status(self, request, queryset, status):
+        """
+        Function to change the status of the selected key results in batches
+        Args:
+            request - HTTP request
+            queryset - selected key results
+            status - new status
+        """
+        updated = _update_status_in_batches(queryset, status)
+        self.message_user(request, "%s key results marked as %s."
+                          % (updated, status.lower()), messages.SUCCESS)
+
+
+def _update_status_in_batches(queryset, status):
+    """
+    Function to update the status of key results in batches. The batches
+    walk the primary key so that each transaction locks few rows
+    Args:
+        queryset - key results to update
+        status - new status
+    Returns:
+        no of key results updated
+    """
+    updated = 0
+    last_pk = None
+    queryset = queryset.order_by("pk")
+    while True:
+        batch = queryset if last_pk is None else \
+                queryset.filter(pk__gt=last_pk)
+        pks = list(batch.values_list("pk", flat=True)[:BULK_UPDATE_BATCH_SIZE])
+        if not pks:
+            # Bulk updates send no signals
+            if updated:
+                bump_metrics_version(queryset.db)
+            return updated
+        with transaction.atomic(using=queryset.db):
+            updated += KeyResults.objects.using(queryset.db).filter(
+                       pk__in=pks).update(status=status,
+                                          status_code=get_status_code(status))
+        last_pk = pks[-1]
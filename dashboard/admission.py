@@ -0,0 +1,334 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Admission control and load shedding of the dashboard endpoints
+#
+# Every endpoint has its own limiter, so a burst of expensive departments
+# requests never holds back the cheap teams lookups. A limiter admits
+# requests while the sum of their costs fits in its `CAPACITY`. Further
+# requests wait in a bounded first in, first out queue for at most
+# `QUEUE_TIMEOUT_SECONDS`; once `MAX_QUEUED` requests wait, or the wait
+# times out, the request is shed with 503 and `Retry-After`.
+#
+# The cost of a request is estimated by the endpoint from what it will
+# scan, e.g. the date span of the filters and the size of the organisation:
+# cost = ceil(span_days / SPAN_DAYS_PER_UNIT) * ceil(org_size / ORG_SIZE_PER_UNIT)
+# capped at the capacity, so that a single request can always be admitted.
+#
+# The limiters are per process, the capacity is what one worker process
+# should run at the same time.
+#
+# Settings(all optional)
+# DASHBOARD_ADMISSION = {
+#     "ENABLED": True,
+#     "RETRY_AFTER_SECONDS": 5,
+#     "SPAN_DAYS_PER_UNIT": 90,
+#     "ORG_SIZE_PER_UNIT": 100000, # objectives
+#     "ENDPOINTS": {
+#         "departments": {"CAPACITY": 8, "MAX_QUEUED": 16,
+#                         "QUEUE_TIMEOUT_SECONDS": 10},
+#     },
+# }
+#
+# Sample usage
+# @admission_control("departments", cost=estimate_fn)
+# def get_departments(request):
+#     ...
+import logging
+import threading
+
+from collections import deque
+from functools import wraps
+from math import ceil
+from time import monotonic
+from traceback import format_exc
+
+from django.conf import settings
+from django.shortcuts import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINT_SETTINGS = {
+    "CAPACITY": 8,
+    "MAX_QUEUED": 16,
+    "QUEUE_TIMEOUT_SECONDS": 10,
+}
+DEFAULT_SETTINGS = {
+    "ENABLED": True,
+    "RETRY_AFTER_SECONDS": 5,
+    "SPAN_DAYS_PER_UNIT": 90,
+    "ORG_SIZE_PER_UNIT": 100000,
+    "ENDPOINTS": {},
+}
+
+_limiters_lock = threading.Lock()
+_limiters = {}
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed by a limiter
+    """
+
+
+def get_admission_settings():
+    """
+    Function to get the admission settings merged with the defaults
+    Returns:
+        dict of DEFAULT_SETTINGS keys
+    """
+    admission_settings = dict(DEFAULT_SETTINGS)
+    admission_settings.update(getattr(settings, "DASHBOARD_ADMISSION", {}))
+    return admission_settings
+
+def get_endpoint_settings(endpoint):
+    """
+    Function to get the limiter settings of an endpoint merged with the
+    defaults
+    Args:
+        endpoint - endpoint name
+    Returns:
+        dict of DEFAULT_ENDPOINT_SETTINGS keys
+    """
+    endpoint_settings = dict(DEFAULT_ENDPOINT_SETTINGS)
+    endpoint_settings.update(
+        get_admission_settings()["ENDPOINTS"].get(endpoint, {}))
+    return endpoint_settings
+
+def estimate_cost(span_days, org_size):
+    """
+    Function to estimate the cost of an analysis from what it scans
+    Args:
+        span_days - no of days covered by the date filters
+        org_size - no of rows of the organisation, e.g. objectives
+    Returns:
+        cost in capacity units, at least 1
+    """
+    admission_settings = get_admission_settings()
+    span_units = ceil(max(span_days, 1) /
+                      admission_settings["SPAN_DAYS_PER_UNIT"])
+    size_units = ceil(max(org_size, 1) /
+                      admission_settings["ORG_SIZE_PER_UNIT"])
+    return span_units * size_units
+
+def get_limiter(endpoint):
+    """
+    Function to get the limiter of an endpoint, created on first use
+    Args:
+        endpoint - endpoint name
+    Returns:
+        _Limiter
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            endpoint_settings = get_endpoint_settings(endpoint)
+            limiter = _limiters[endpoint] = _Limiter(
+                endpoint, endpoint_settings["CAPACITY"],
+                endpoint_settings["MAX_QUEUED"],
+                endpoint_settings["QUEUE_TIMEOUT_SECONDS"])
+    return limiter
+
+def get_admission_stats():
+    """
+    Function to get the counters of the limiters of this process
+    Returns:
+        {
+            "departments": {"capacity": 8, "units_in_use": 6, "running": 2,
+                            "queued": 1, "admitted": 120, "queued_total": 14,
+                            "shed": 3, "timed_out": 1}
+        }
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return dict((limiter.endpoint, limiter.get_stats())
+                for limiter in limiters)
+
+def admission_control(endpoint, cost=None):
+    """
+    Decorator which runs the view only once its endpoint's limiter admits
+    the request, else responds with 503 and `Retry-After`
+    Args:
+        endpoint - endpoint name, the limiter is shared by its views
+        cost - function which estimates the cost of a request, called as
+               cost(request), default 1
+    Returns:
+        decorator
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            admission_settings = get_admission_settings()
+            if not admission_settings["ENABLED"]:
+                return view(request, *args, **kwargs)
+            limiter = get_limiter(endpoint)
+            try:
+                units = limiter.acquire(_get_cost(cost, request))
+            except AdmissionRejected as err:
+                logger.warning("Shedding %s request %s: %s"
+                               % (endpoint, request.get_full_path(), str(err)))
+                response = HttpResponse("Server busy, retry later",
+                                        status=503)
+                response["Retry-After"] = str(
+                    admission_settings["RETRY_AFTER_SECONDS"])
+                return response
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                limiter.release(units)
+                raise
+            if response.streaming:
+                # A streamed page does its work while it is sent
+                response.streaming_content = _ReleasingIterator(
+                    response.streaming_content, limiter, units)
+            else:
+                limiter.release(units)
+            return response
+        return wrapper
+    return decorator
+
+def _get_cost(cost, request):
+    """
+    Function to estimate the cost of a request
+    Args:
+        cost - cost function of the endpoint, None for a cost of 1
+        request - HTTP request
+    Returns:
+        cost in capacity units
+    """
+    if cost is None:
+        return 1
+    try:
+        return cost(request)
+    except Exception as err:
+        # A request which can't be estimated is admitted at the lowest cost,
+        # the view reports the actual error
+        logger.warning("Error estimating the cost of %s, Error: %s, Stack: %s"
+                       % (request.get_full_path(), str(err), format_exc()))
+        return 1
+
+
+class _Limiter(object):
+    """
+    Cost weighted concurrency limiter with a bounded first in, first out
+    wait queue
+    """
+
+    def __init__(self, endpoint, capacity, max_queued, queue_timeout):
+        self.endpoint = endpoint
+        self.capacity = capacity
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        self._units_in_use = 0
+        self._running = 0
+        self._admitted = 0
+        self._queued_total = 0
+        self._shed = 0
+        self._timed_out = 0
+
+    def acquire(self, cost):
+        """
+        Function to admit a request, waiting in the queue if needed
+        Args:
+            cost - cost of the request, capped at the capacity
+        Returns:
+            units taken, to be given back with `release`
+        Raises:
+            AdmissionRejected if the queue is full or the wait timed out
+        """
+        units = min(max(int(cost), 1), self.capacity)
+        with self._condition:
+            if not self._waiting and \
+                    self._units_in_use + units <= self.capacity:
+                self._admit(units)
+                return units
+            if len(self._waiting) >= self.max_queued:
+                self._shed += 1
+                raise AdmissionRejected("%s requests already queued"
+                                        % len(self._waiting))
+            ticket = object()
+            self._waiting.append(ticket)
+            self._queued_total += 1
+            deadline = monotonic() + self.queue_timeout
+            try:
+                # Only the head of the queue is admitted, so a heavy request
+                # isn't starved by the cheaper ones behind it
+                while self._waiting[0] is not ticket or \
+                        self._units_in_use + units > self.capacity:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self._shed += 1
+                        self._timed_out += 1
+                        raise AdmissionRejected("queued for more than %ss"
+                                                % self.queue_timeout)
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                # The next request in the queue may fit now
+                self._condition.notify_all()
+            self._admit(units)
+        return units
+
+    def release(self, units):
+        """
+        Function to give back the units of a finished request
+        Args:
+            units - units returned by `acquire`
+        """
+        with self._condition:
+            self._units_in_use -= units
+            self._running -= 1
+            self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            return {
+                "capacity": self.capacity,
+                "units_in_use": self._units_in_use,
+                "running": self._running,
+                "queued": len(self._waiting),
+                "admitted": self._admitted,
+                "queued_total": self._queued_total,
+                "shed": self._shed,
+                "timed_out": self._timed_out,
+            }
+
+    def _admit(self, units):
+        self._units_in_use += units
+        self._running += 1
+        self._admitted += 1
+
+
+class _ReleasingIterator(object):
+    """
+    Streaming content which gives back the units of its request once it is
+    exhausted or closed
+    """
+
+    def __init__(self, content, limiter, units):
+        self._content = iter(content)
+        self._limiter = limiter
+        self._units = units
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._content)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        if hasattr(self._content, "close"):
+            self._content.close()
+        self._limiter.release(self._units)
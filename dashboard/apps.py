@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class DashboardConfig(AppConfig):
     name = 'dashboard'
+
+    def ready(self):
+        # Connect the signal handlers
+        from .signals import connect_signals
+        connect_signals()
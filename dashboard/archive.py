@@ -0,0 +1,191 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Cold-data archival of the key results
+#
+# Key results last updated before the archival horizon are moved from
+# `keyresults` to `keyresults_archive` in small batches. For every objective
+# and day they leave a `keyresults_summary` row behind with the no of key
+# results and the no of pending key results, which is all the dashboard
+# aggregations need. The summaries are kept per day so that every date window
+# returns exactly the same answer as before the archival.
+#
+# Reads go through `objectives_with_keyresults_q` which unions the hot table
+# and the summaries.
+#
+# Settings(all optional)
+# DASHBOARD_ARCHIVE = {
+#     "HORIZON_DAYS": 730, # archive key results older than this
+#     "BATCH_SIZE": 1000, # key results moved per transaction
+# }
+#
+# Sample usage
+# Objectives.objects.filter(objectives_with_keyresults_q(since=date(2020, 8, 1)))
+import logging
+
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .compact import get_compact_settings
+from .models import (COMPLETE_CODE, KeyResults, KeyResultsArchive,
+                     KeyResultsSummary, Objectives)
+from .signals import metrics_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "HORIZON_DAYS": 730,
+    "BATCH_SIZE": 1000,
+}
+COMPLETE_STATUS = "Complete"
+
+
+def get_archive_settings():
+    """
+    Function to get the archival settings merged with the defaults
+    Returns:
+        dict of DEFAULT_SETTINGS keys
+    """
+    archive_settings = dict(DEFAULT_SETTINGS)
+    archive_settings.update(getattr(settings, "DASHBOARD_ARCHIVE", {}))
+    return archive_settings
+
+def objectives_with_keyresults_q(since=None, until=None, pending=False):
+    """
+    Function to get the condition for an objective to have at least one key
+    result matching the filters, in the hot table or in the archive
+    Args:
+        since - key results updated on or after this date
+        until - key results updated on or before this date
+        pending - only key results which are not complete
+    Returns:
+        Q object on Objectives
+    """
+    keyresults = KeyResults.objects.filter(objective_id__isnull=False)
+    summaries = KeyResultsSummary.objects.all()
+    if since is not None:
+        keyresults = keyresults.filter(updated_date__gte=since)
+        summaries = summaries.filter(updated_date__gte=since)
+    if until is not None:
+        keyresults = keyresults.filter(updated_date__lte=until)
+        summaries = summaries.filter(updated_date__lte=until)
+    if pending:
+        if get_compact_settings()["STATUS_CODE_READS"]:
+            keyresults = keyresults.filter(~Q(status_code=COMPLETE_CODE))
+        else:
+            keyresults = keyresults.filter(~Q(status=COMPLETE_STATUS))
+        summaries = summaries.filter(pending_count__gt=0)
+    # The key results reference the objective's surrogate key
+    return Q(sid__in=keyresults.values("objective_id")) | \
+           Q(pk__in=summaries.values("objective_id"))
+
+def get_archive_cutoff(horizon_days=None):
+    """
+    Function to get the date before which key results are archived
+    Args:
+        horizon_days - archival horizon, default from the settings
+    Returns:
+        date
+    """
+    if horizon_days is None:
+        horizon_days = get_archive_settings()["HORIZON_DAYS"]
+    return date.today() - timedelta(days=horizon_days)
+
+def archive_keyresults_batch(cutoff, batch_size, using="default"):
+    """
+    Function to archive one batch of key results updated before the cutoff.
+    The batch is moved in a single short transaction, so the readers see
+    either the hot rows or the summaries, never both or neither. The metrics
+    version is bumped once per batch
+    Args:
+        cutoff - key results updated before this date are archived
+        batch_size - max no of key results to move
+        using - database alias of the shard
+    Returns:
+        no of key results archived, 0 once nothing is left to archive
+    """
+    with transaction.atomic(using=using):
+        batch = list(KeyResults.objects.using(using).select_for_update(
+                     ).filter(updated_date__lt=cutoff).order_by(
+                     "pk")[:batch_size])
+        if not batch:
+            return 0
+        objective_ids = _get_objective_ids(batch, using)
+        KeyResultsArchive.objects.using(using).bulk_create([
+            KeyResultsArchive(
+                keyresult_id=keyresult.keyresult_id,
+                objective_id_id=objective_ids.get(keyresult.objective_id_id),
+                keyresult_text=keyresult.keyresult_text,
+                status=keyresult.status,
+                due_date=keyresult.due_date,
+                updated_date=keyresult.updated_date)
+            for keyresult in batch])
+        _add_to_summaries(batch, objective_ids, using)
+        with metrics_batch(using):
+            KeyResults.objects.using(using).filter(
+                pk__in=[keyresult.pk for keyresult in batch]).delete()
+    return len(batch)
+
+def _get_objective_ids(keyresults, using):
+    """
+    Function to get the ids of the objectives of key results, which the
+    archive and the summaries reference
+    Args:
+        keyresults - list of KeyResults objects
+        using - database alias of the shard
+    Returns:
+        {objective surrogate key: objective_id}
+    """
+    sids = set(keyresult.objective_id_id for keyresult in keyresults
+               if keyresult.objective_id_id is not None)
+    if not sids:
+        return {}
+    return dict(Objectives.objects.using(using).filter(
+                sid__in=sids).values_list("sid", "pk"))
+
+def _add_to_summaries(keyresults, objective_ids, using):
+    """
+    Function to add archived key results to the per objective, per day
+    summaries
+    Args:
+        keyresults - list of KeyResults objects
+        objective_ids - output of _get_objective_ids
+        using - database alias of the shard
+    """
+    counts = {}
+    for keyresult in keyresults:
+        # Key results without an objective are not part of any aggregation
+        if keyresult.objective_id_id is None:
+            continue
+        key = (objective_ids[keyresult.objective_id_id],
+               keyresult.updated_date)
+        keyresults_count, pending_count = counts.get(key, (0, 0))
+        counts[key] = (keyresults_count + 1,
+                       pending_count + (keyresult.status != COMPLETE_STATUS))
+    if not counts:
+        return
+    objective_ids = set(objective_id for objective_id, _ in counts)
+    summaries = KeyResultsSummary.objects.using(using)
+    existing = summaries.select_for_update().filter(
+               objective_id__in=objective_ids,
+               updated_date__in=set(updated_date for _, updated_date in counts))
+    for summary in existing:
+        key = (summary.objective_id_id, summary.updated_date)
+        if key not in counts:
+            continue
+        keyresults_count, pending_count = counts.pop(key)
+        summaries.filter(pk=summary.pk).update(
+            keyresults_count=F("keyresults_count") + keyresults_count,
+            pending_count=F("pending_count") + pending_count)
+    summaries.bulk_create([
+        KeyResultsSummary(objective_id_id=objective_id,
+                          updated_date=updated_date,
+                          keyresults_count=keyresults_count,
+                          pending_count=pending_count)
+        for (objective_id, updated_date), (keyresults_count, pending_count)
+        in counts.items()])
@@ -0,0 +1,271 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Stale-while-revalidate cache for the analytical data
+#
+# A computed value is served from the cache while it is fresh. Once it is
+# older than `FRESH_SECONDS` and younger than `FRESH_SECONDS + STALE_SECONDS`
+# it is still served right away, while a single background worker recomputes
+# it. Concurrent misses for the same key coalesce into one computation: in
+# the same process through a shared in-flight entry, across processes through
+# a lock key in the cache (needs a shared cache backend, e.g. memcached).
+#
+# Settings(all optional)
+# DASHBOARD_CACHE = {
+#     "ENABLED": True,
+#     "ALIAS": "default", # cache alias from settings.CACHES
+#     "FRESH_SECONDS": 60,
+#     "STALE_SECONDS": 3600,
+#     "LOCK_SECONDS": 120, # upper bound of a computation
+# }
+#
+# Sample usage
+# value, computed_at = get_or_compute("departments:1 weeks", compute_fn)
+# Check if a value is served without computing it, e.g. to price a request
+# is_cached("departments:1 weeks")
+# Always compute in the current thread, e.g. while profiling
+# with bypass_cache():
+#     value, computed_at = get_or_compute("departments:1 weeks", compute_fn)
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from hashlib import md5
+from time import sleep, time
+from traceback import format_exc
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "ENABLED": True,
+    "ALIAS": "default",
+    "FRESH_SECONDS": 60,
+    "STALE_SECONDS": 3600,
+    "LOCK_SECONDS": 120,
+}
+KEY_PREFIX = "dashboard:swr:"
+# Interval at which a process waits for another process' computation
+LOCK_POLL_SECONDS = 0.05
+
+# One background worker recomputes stale entries
+_revalidation_executor = ThreadPoolExecutor(max_workers=1)
+_flights_lock = threading.Lock()
+_flights = {}
+_local = threading.local()
+
+
+class _Flight(object):
+    """
+    In-flight computation of a key, shared by the concurrent callers
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+def get_cache_settings():
+    """
+    Function to get the cache settings merged with the defaults
+    Returns:
+        dict of DEFAULT_SETTINGS keys
+    """
+    cache_settings = dict(DEFAULT_SETTINGS)
+    cache_settings.update(getattr(settings, "DASHBOARD_CACHE", {}))
+    return cache_settings
+
+@contextmanager
+def bypass_cache():
+    """
+    Context manager within which `get_or_compute` computes every value in
+    the calling thread without reading or writing the cache
+    """
+    previous = getattr(_local, "bypass", False)
+    _local.bypass = True
+    try:
+        yield
+    finally:
+        _local.bypass = previous
+
+def get_or_compute(key, compute):
+    """
+    Function to get a value with stale-while-revalidate semantics
+    Args:
+        key - cache key of the value
+        compute - function without args which computes the value
+    Returns:
+        value - fresh or stale value
+        computed_at - epoch seconds at which the value was computed
+    """
+    cache_settings = get_cache_settings()
+    if not cache_settings["ENABLED"] or getattr(_local, "bypass", False):
+        return (compute(), time())
+    cache_key = _make_key(key)
+    cache = caches[cache_settings["ALIAS"]]
+    entry = cache.get(cache_key)
+    if entry is not None and _is_servable(entry, cache_settings):
+        age = time() - entry["computed_at"]
+        if age < cache_settings["FRESH_SECONDS"]:
+            return (entry["value"], entry["computed_at"])
+        logger.debug("Serving stale value of %s, age: %.1fs" % (key, age))
+        _revalidate_in_background(key, cache_key, compute, cache_settings)
+        return (entry["value"], entry["computed_at"])
+    entry = _compute_single_flight(key, cache_key, compute, cache_settings)
+    return (entry["value"], entry["computed_at"])
+
+def is_cached(key):
+    """
+    Function to check if `get_or_compute` would serve the value of a key from
+    the cache, fresh or stale, without computing it in the calling thread
+    Args:
+        key - cache key of the value
+    Returns:
+        True if a servable value is cached
+    """
+    cache_settings = get_cache_settings()
+    if not cache_settings["ENABLED"] or getattr(_local, "bypass", False):
+        return False
+    entry = caches[cache_settings["ALIAS"]].get(_make_key(key))
+    return entry is not None and _is_servable(entry, cache_settings)
+
+def _make_key(key):
+    """
+    Function to make a cache key which is safe for every cache backend
+    Args:
+        key - readable key
+    Returns:
+        prefixed hash of the key
+    """
+    return KEY_PREFIX + md5(key.encode("utf-8")).hexdigest()
+
+def _is_servable(entry, cache_settings):
+    """
+    Function to check if an entry is within the staleness bound
+    Args:
+        entry - cached {"value": <value>, "computed_at": <epoch seconds>}
+        cache_settings - settings from `get_cache_settings`
+    Returns:
+        True if the entry can be served
+    """
+    return time() - entry["computed_at"] < \
+           cache_settings["FRESH_SECONDS"] + cache_settings["STALE_SECONDS"]
+
+def _compute_single_flight(key, cache_key, compute, cache_settings):
+    """
+    Function to compute a missing value once for all the concurrent callers
+    Args:
+        key - readable key, for logging
+        cache_key - cache key of the value
+        compute - function which computes the value
+        cache_settings - settings from `get_cache_settings`
+    Returns:
+        {"value": <value>, "computed_at": <epoch seconds>}
+    """
+    with _flights_lock:
+        flight = _flights.get(cache_key)
+        leader = flight is None
+        if leader:
+            flight = _flights[cache_key] = _Flight()
+    if not leader:
+        logger.debug("Waiting for the in-flight computation of %s" % key)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.entry
+    try:
+        flight.entry = _compute_across_processes(key, cache_key, compute,
+                                                 cache_settings)
+        return flight.entry
+    except Exception as err:
+        flight.error = err
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(cache_key, None)
+        flight.done.set()
+
+def _compute_across_processes(key, cache_key, compute, cache_settings):
+    """
+    Function to compute a value unless another process is already computing
+    it, in which case its result is awaited up to `LOCK_SECONDS`
+    Args:
+        key - readable key, for logging
+        cache_key - cache key of the value
+        compute - function which computes the value
+        cache_settings - settings from `get_cache_settings`
+    Returns:
+        {"value": <value>, "computed_at": <epoch seconds>}
+    """
+    cache = caches[cache_settings["ALIAS"]]
+    lock_key = cache_key + ":lock"
+    if not cache.add(lock_key, 1, cache_settings["LOCK_SECONDS"]):
+        deadline = time() + cache_settings["LOCK_SECONDS"]
+        while time() < deadline:
+            sleep(LOCK_POLL_SECONDS)
+            entry = cache.get(cache_key)
+            if entry is not None and _is_servable(entry, cache_settings):
+                return entry
+            if cache.add(lock_key, 1, cache_settings["LOCK_SECONDS"]):
+                break
+        else:
+            logger.warning("Timed out waiting for the computation of %s, "
+                           "computing it in this process" % key)
+    try:
+        return _compute_and_store(key, cache_key, compute, cache_settings)
+    finally:
+        cache.delete(lock_key)
+
+def _compute_and_store(key, cache_key, compute, cache_settings):
+    """
+    Function to compute a value and store it in the cache
+    Args:
+        key - readable key, for logging
+        cache_key - cache key of the value
+        compute - function which computes the value
+        cache_settings - settings from `get_cache_settings`
+    Returns:
+        {"value": <value>, "computed_at": <epoch seconds>}
+    """
+    started = time()
+    entry = {"value": compute(), "computed_at": started}
+    caches[cache_settings["ALIAS"]].set(
+        cache_key, entry,
+        cache_settings["FRESH_SECONDS"] + cache_settings["STALE_SECONDS"])
+    logger.info("Computed %s in %.3fs" % (key, time() - started))
+    return entry
+
+def _revalidate_in_background(key, cache_key, compute, cache_settings):
+    """
+    Function to recompute a stale value on the background worker. Only the
+    caller which takes the lock key schedules the recomputation
+    Args:
+        key - readable key, for logging
+        cache_key - cache key of the value
+        compute - function which computes the value
+        cache_settings - settings from `get_cache_settings`
+    """
+    cache = caches[cache_settings["ALIAS"]]
+    lock_key = cache_key + ":lock"
+    if not cache.add(lock_key, 1, cache_settings["LOCK_SECONDS"]):
+        return
+
+    def revalidate():
+        try:
+            _compute_and_store(key, cache_key, compute, cache_settings)
+        except Exception as err:
+            logger.error("Error while revalidating %s, Error: %s, Stack: %s"
+                         % (key, str(err), format_exc()))
+        finally:
+            cache.delete(lock_key)
+            # The worker thread owns its own DB connections
+            connections.close_all()
+
+    _revalidation_executor.submit(revalidate)
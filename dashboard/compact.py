@@ -0,0 +1,272 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Migration of the dashboard tables to a compact schema
+#
+# The string primary keys and the free text status make every row, index and
+# join of the aggregations wider than it needs to be. The migration runs in
+# steps, each of which can be deployed on its own
+# 1. migration 0004 adds the nullable `status_code` and `objective_sid` of
+#    the key results and the integer surrogate keys(`sid`) next to the
+#    existing columns. On PostgreSQL the surrogate keys of new rows come
+#    from a sequence per table from then on, raw SQL inserts included
+# 2. the `compact_schema` command fills them in small batches: the status
+#    codes, the surrogate keys and the surrogate key of the objective of
+#    every key result, from the string `objective_id_id` column. Rows
+#    already filled are skipped, so it can be stopped and rerun at any time,
+#    and rerun to catch up with rows written outside of the ORM. Status
+#    codes which went out of step with the status, e.g. after a
+#    `QuerySet.update()` of the status, are corrected as well
+# 3. `STATUS_CODE_READS` switches the aggregations to the status code
+# 4. migration 0006 checks the backfill is done, it fills at most a batch
+#    of rows per table itself, and makes the surrogate keys NOT NULL
+# 5. migration 0007 makes the key results reference their objective by its
+#    surrogate key and drops the string `objective_id_id` column and its
+#    index. The other foreign keys and the primary keys can follow the same
+#    way, the string keys stay as unique natural keys
+#
+# New key results get their status code on save, and new rows their
+# surrogate key from the INSERT, see dashboard/models.py.
+#
+# Settings(all optional)
+# DASHBOARD_COMPACT_SCHEMA = {
+#     "STATUS_CODE_READS": False, # enable once the status codes are filled
+#     "BATCH_SIZE": 1000, # rows updated per transaction
+# }
+#
+# Sample usage
+# while backfill_status_codes_batch(1000, "default"):
+#     pass
+# corrected, after_pk = resync_status_codes_batch(1000, None, "default")
+# get_table_sizes("default")
+import logging
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+
+from .live import bump_metrics_version_on_commit
+from .models import (COMPLETE_CODE, PENDING_CODE, Department, KeyResults,
+                     NextSurrogateKey, Objectives, Teams, Users)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "STATUS_CODE_READS": False,
+    "BATCH_SIZE": 1000,
+}
+COMPLETE_STATUS = "Complete"
+# Models with a surrogate key
+SURROGATE_KEY_MODELS = (Department, Teams, Users, Objectives, KeyResults)
+# (model, string foreign key column, related model, column of the related
+# surrogate key) of the foreign keys being moved to the surrogate keys
+SURROGATE_FOREIGN_KEYS = (
+    (KeyResults, "objective_id_id", Objectives, "objective_sid"),
+)
+
+
+def get_compact_settings():
+    """
+    Function to get the compact schema settings merged with the defaults
+    Returns:
+        dict of DEFAULT_SETTINGS keys
+    """
+    compact_settings = dict(DEFAULT_SETTINGS)
+    compact_settings.update(getattr(settings, "DASHBOARD_COMPACT_SCHEMA", {}))
+    return compact_settings
+
+def backfill_status_codes_batch(batch_size, using="default"):
+    """
+    Function to fill the status code of one batch of key results
+    Args:
+        batch_size - max no of key results to update
+        using - database alias of the shard
+    Returns:
+        no of key results updated, 0 once all are filled
+    """
+    keyresults = KeyResults.objects.using(using)
+    with transaction.atomic(using=using):
+        pks = list(keyresults.filter(status_code__isnull=True,
+                                     status__isnull=False).order_by(
+                   "pk").values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return 0
+        keyresults.filter(pk__in=pks, status=COMPLETE_STATUS).update(
+            status_code=COMPLETE_CODE)
+        keyresults.filter(pk__in=pks).exclude(status=COMPLETE_STATUS).update(
+            status_code=PENDING_CODE)
+        # The aggregations may read the status codes, bulk updates send no
+        # signals
+        bump_metrics_version_on_commit(using)
+    return len(pks)
+
+def resync_status_codes_batch(batch_size, after_pk=None, using="default"):
+    """
+    Function to correct the status codes of one batch of key results, in
+    primary key order, which went out of step with their status
+    Args:
+        batch_size - max no of key results to check
+        after_pk - primary key after which the batch starts, None for the
+                   first batch
+        using - database alias of the shard
+    Returns:
+        no of key results corrected
+        primary key to pass to the next batch, None once all are checked
+    """
+    keyresults = KeyResults.objects.using(using)
+    batch = keyresults.order_by("pk")
+    if after_pk is not None:
+        batch = batch.filter(pk__gt=after_pk)
+    with transaction.atomic(using=using):
+        pks = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return (0, None)
+        keyresults = keyresults.filter(pk__in=pks)
+        # Only the rows whose code doesn't match are written, the status is
+        # checked by the update itself so a concurrent change is not undone
+        corrected = keyresults.filter(status=COMPLETE_STATUS).filter(
+                    ~Q(status_code=COMPLETE_CODE)).update(
+                    status_code=COMPLETE_CODE)
+        corrected += keyresults.filter(status__isnull=False).exclude(
+                     status=COMPLETE_STATUS).filter(
+                     ~Q(status_code=PENDING_CODE)).update(
+                     status_code=PENDING_CODE)
+        corrected += keyresults.filter(status__isnull=True,
+                                       status_code__isnull=False).update(
+                     status_code=None)
+        if corrected:
+            bump_metrics_version_on_commit(using)
+    return (corrected, pks[-1] if len(pks) == batch_size else None)
+
+def backfill_surrogate_keys_batch(model, batch_size, using="default"):
+    """
+    Function to number one batch of the rows of a model without a surrogate
+    key, from the sequence of the table on PostgreSQL, else after the
+    highest surrogate key
+    Args:
+        model - model with a `sid` field
+        batch_size - max no of rows to number
+        using - database alias of the shard
+    Returns:
+        no of rows numbered, 0 once all are numbered
+    """
+    rows = model.objects.using(using)
+    next_sid = NextSurrogateKey(model._meta.db_table)
+    with transaction.atomic(using=using):
+        pks = list(rows.select_for_update().filter(
+                   sid__isnull=True).order_by("pk").values_list(
+                   "pk", flat=True)[:batch_size])
+        if not pks:
+            return 0
+        if connections[using].vendor == "postgresql":
+            rows.filter(pk__in=pks).update(sid=next_sid)
+        else:
+            # The highest key is read once per statement
+            for pk in pks:
+                rows.filter(pk=pk).update(sid=next_sid)
+    return len(pks)
+
+def backfill_surrogate_foreign_keys_batch(model, column, related_model,
+                                          sid_column, batch_size,
+                                          using="default"):
+    """
+    Function to copy the surrogate key of the related row to one batch of
+    rows, through the string foreign key column which the models no longer
+    know. Rows whose related row isn't numbered yet are left for a later run
+    Args:
+        model - model with the foreign key
+        column - string foreign key column
+        related_model - model the foreign key references
+        sid_column - column of the related surrogate key
+        batch_size - max no of rows to update
+        using - database alias of the shard
+    Returns:
+        no of rows updated, 0 once all are filled or the string column is
+        dropped(migration 0007)
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        columns = [column_info.name for column_info in
+                   connection.introspection.get_table_description(cursor,
+                                                                  table)]
+    if column not in columns:
+        return 0
+    quote = connection.ops.quote_name
+    related_table = quote(related_model._meta.db_table)
+    related_pk = "%s.%s" % (related_table,
+                            quote(related_model._meta.pk.column))
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT %(pk)s FROM %(table)s INNER JOIN %(related_table)s ON "
+            "%(related_pk)s = %(table)s.%(column)s WHERE %(table)s.%(sid)s IS "
+            "NULL AND %(related_table)s.sid IS NOT NULL ORDER BY %(pk)s "
+            "LIMIT %%s" % {
+                "pk": "%s.%s" % (quote(table), quote(model._meta.pk.column)),
+                "table": quote(table), "related_table": related_table,
+                "related_pk": related_pk, "column": quote(column),
+                "sid": quote(sid_column)}, [batch_size])
+        pks = [pk for pk, in cursor.fetchall()]
+        if not pks:
+            return 0
+        cursor.execute(
+            "UPDATE %(table)s SET %(sid)s = (SELECT sid FROM %(related_table)s "
+            "WHERE %(related_pk)s = %(table)s.%(column)s) WHERE %(pk)s IN "
+            "(%(params)s)" % {
+                "table": quote(table), "sid": quote(sid_column),
+                "related_table": related_table, "related_pk": related_pk,
+                "column": quote(column), "pk": quote(model._meta.pk.column),
+                "params": ", ".join(["%s"] * len(pks))}, pks)
+    return len(pks)
+
+def get_table_sizes(using="default"):
+    """
+    Function to get the on disk size of the tables and indexes of the
+    surrogate key models
+    Args:
+        using - database alias of the shard
+    Returns:
+        {"department": (table_bytes, index_bytes), ...}, the sizes are None
+        when the backend can't report them
+    """
+    connection = connections[using]
+    sizes = {}
+    with connection.cursor() as cursor:
+        for model in SURROGATE_KEY_MODELS:
+            table = model._meta.db_table
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_table_size(%s::regclass), "
+                               "pg_indexes_size(%s::regclass)",
+                               [table, table])
+                sizes[table] = tuple(cursor.fetchone())
+            elif connection.vendor == "sqlite":
+                sizes[table] = _get_sqlite_table_size(cursor, table)
+            else:
+                sizes[table] = (None, None)
+    return sizes
+
+def _get_sqlite_table_size(cursor, table):
+    """
+    Function to get the size of a SQLite table and its indexes from the
+    `dbstat` virtual table
+    Args:
+        cursor - database cursor
+        table - table name
+    Returns:
+        (table_bytes, index_bytes), (None, None) when SQLite is built
+        without `dbstat`
+    """
+    try:
+        cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = %s",
+                       [table])
+        table_size = cursor.fetchone()[0]
+        cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                       "(SELECT name FROM sqlite_master WHERE type = 'index' "
+                       "AND tbl_name = %s)", [table])
+        index_size = cursor.fetchone()[0] or 0
+    except Exception as err:
+        logger.debug("SQLite table sizes not available, Error: %s" % str(err))
+        return (None, None)
+    return (table_size, index_size)
@@ -0,0 +1,438 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Live updates of the departments analysis over server-sent events
+#
+# Every committed transaction which changes the dashboard models bumps the
+# metrics version of its shard, a row of `metrics_version` on every shard(see
+# dashboard/signals.py), so changes made by any process, including the
+# management commands, reach the clients of every worker. For each filter
+# combination with connected clients, one broadcaster thread per process
+# polls the versions, recomputes the
+# analysis once when they moved and fans the delta out to every client. Each
+# client has a small bounded queue; a client which falls behind has its
+# queued deltas dropped and gets a full snapshot instead, so a slow
+# consumer never holds back the broadcaster or grows memory.
+#
+# Events
+# `snapshot`: the complete analysis
+# {"objectives_on_track": {...}, "objectives_updated_recently": {...},
+#  "departments": {"<department_id>": {...}}}
+# `delta`: only the changed values, removed departments are null
+# {"objectives_on_track": {"on_track": 2}, "departments": {"1": {"users_count": 3}}}
+#
+# Settings(all optional)
+# DASHBOARD_LIVE = {
+#     "POLL_SECONDS": 2, # how often the metrics version is checked
+#     "HEARTBEAT_SECONDS": 15, # keepalive comment for idle streams
+#     "MAX_SUBSCRIBERS": 8, # connected clients per process, each holds a
+#                           # server thread while it is connected
+#     "QUEUE_SIZE": 10, # events buffered per client
+# }
+import logging
+import queue
+import threading
+
+from functools import partial
+from json import dumps
+from traceback import format_exc
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+
+from .models import MetricsVersion
+from .sharding import get_shards
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "POLL_SECONDS": 2,
+    "HEARTBEAT_SECONDS": 15,
+    "MAX_SUBSCRIBERS": 8,
+    "QUEUE_SIZE": 10,
+}
+# Primary key of the version row, created by migration 0005
+VERSION_ID = 1
+SNAPSHOT_EVENT = "snapshot"
+DELTA_EVENT = "delta"
+
+_registry_lock = threading.Lock()
+_broadcasters = {}
+_subscriber_count = 0
+# The on commit callback of each shard, see bump_metrics_version_on_commit
+_bumps = {}
+
+
+class SubscriberLimitReached(Exception):
+    """
+    Raised when a process already streams to MAX_SUBSCRIBERS clients
+    """
+
+
+def get_live_settings():
+    """
+    Function to get the live update settings merged with the defaults
+    Returns:
+        dict of DEFAULT_SETTINGS keys
+    """
+    live_settings = dict(DEFAULT_SETTINGS)
+    live_settings.update(getattr(settings, "DASHBOARD_LIVE", {}))
+    return live_settings
+
+def bump_metrics_version(using=None):
+    """
+    Function to record that the data behind the metrics changed. Call it
+    once the change is committed
+    Args:
+        using - database alias of the shard which changed, default the
+                first shard
+    """
+    versions = MetricsVersion.objects.using(using or get_shards()[0])
+    if versions.filter(pk=VERSION_ID).update(version=F("version") + 1):
+        return
+    # The row is missing, e.g. after `manage.py flush`
+    _, created = versions.get_or_create(pk=VERSION_ID,
+                                        defaults={"version": 1})
+    if not created:
+        versions.filter(pk=VERSION_ID).update(version=F("version") + 1)
+
+def bump_metrics_version_on_commit(using):
+    """
+    Function to bump the metrics version of a shard once the current
+    transaction on it commits, once however many changes it makes. Outside
+    a transaction the version is bumped right away
+    Args:
+        using - database alias of the shard
+    """
+    bump = _bumps.setdefault(using, partial(bump_metrics_version, using))
+    connection = transaction.get_connection(using)
+    # The callbacks of a transaction or savepoint which is rolled back are
+    # dropped with it
+    if connection.in_atomic_block and any(
+            callback is bump for _, callback in connection.run_on_commit):
+        return
+    transaction.on_commit(bump, using=using)
+
+def get_metrics_version():
+    """
+    Function to get the current metrics version, the sum of the versions of
+    the shards
+    Returns:
+        version, None if the version rows are missing
+    """
+    versions = [MetricsVersion.objects.using(using).filter(
+                pk=VERSION_ID).values_list("version", flat=True).first()
+                for using in get_shards()]
+    versions = [version for version in versions if version is not None]
+    return sum(versions) if versions else None
+
+def stream(key, compute):
+    """
+    Function to stream the analysis of a filter combination to one client
+    Args:
+        key - filter combination the analysis is computed for
+        compute - function without args which computes the analysis
+    Returns:
+        iterator of server-sent event strings, close it to disconnect the
+        client
+    Raises:
+        SubscriberLimitReached if no more clients can be served
+    """
+    return _EventStream(_subscribe(key, compute))
+
+def _subscribe(key, compute):
+    """
+    Function to register a client with the broadcaster of its filters
+    Args:
+        key - filter combination
+        compute - function which computes the analysis
+    Returns:
+        _Subscriber
+    """
+    global _subscriber_count
+    live_settings = get_live_settings()
+    with _registry_lock:
+        if _subscriber_count >= live_settings["MAX_SUBSCRIBERS"]:
+            raise SubscriberLimitReached()
+        broadcaster = _broadcasters.get(key)
+        if broadcaster is None:
+            broadcaster = _broadcasters[key] = _Broadcaster(key, compute,
+                                                            live_settings)
+        subscriber = _Subscriber(broadcaster, live_settings["QUEUE_SIZE"])
+        broadcaster.add(subscriber)
+        _subscriber_count += 1
+    return subscriber
+
+def _unsubscribe(subscriber):
+    """
+    Function to remove a disconnected client, the broadcaster stops with its
+    last client
+    Args:
+        subscriber - _Subscriber
+    """
+    global _subscriber_count
+    with _registry_lock:
+        if subscriber.unsubscribed:
+            return
+        subscriber.unsubscribed = True
+        broadcaster = subscriber.broadcaster
+        broadcaster.remove(subscriber)
+        _subscriber_count -= 1
+        if not broadcaster.has_subscribers():
+            broadcaster.stop()
+            _broadcasters.pop(broadcaster.key, None)
+
+def _stream_events(subscriber):
+    """
+    Generator of the events of a client, with heartbeats while idle
+    Args:
+        subscriber - _Subscriber
+    """
+    heartbeat = get_live_settings()["HEARTBEAT_SECONDS"]
+    try:
+        # Tell EventSource how long to wait before reconnecting
+        yield "retry: %s\n\n" % (heartbeat * 1000)
+        while True:
+            event = subscriber.next_event(heartbeat)
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            event_type, data = event
+            yield "event: %s\ndata: %s\n\n" % (event_type, dumps(data))
+    finally:
+        _unsubscribe(subscriber)
+
+
+class _EventStream(object):
+    """
+    Iterator of the events of a client. The server closes it when the client
+    disconnects, which unsubscribes the client even if no event was sent yet
+    """
+
+    def __init__(self, subscriber):
+        self._subscriber = subscriber
+        self._events = _stream_events(subscriber)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        self._events.close()
+        _unsubscribe(self._subscriber)
+
+
+class _Subscriber(object):
+    """
+    Connected client with a bounded queue of events
+    """
+
+    def __init__(self, broadcaster, queue_size):
+        self.broadcaster = broadcaster
+        self.unsubscribed = False
+        self._events = queue.Queue(maxsize=queue_size)
+        self._resync = threading.Event()
+        # A new client starts with a snapshot
+        self._resync.set()
+
+    def offer(self, event):
+        """
+        Function to queue an event without ever blocking the broadcaster.
+        When the queue is full, the queued events are dropped and the client
+        is resynchronised with a snapshot instead
+        Args:
+            event - (event_type, data)
+        """
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            self._drain()
+            self._resync.set()
+            self._events.put_nowait(None)
+
+    def next_event(self, timeout):
+        """
+        Function to wait for the next event of the client
+        Args:
+            timeout - seconds to wait
+        Returns:
+            (event_type, data), None on timeout
+        """
+        if not self._resync.is_set():
+            try:
+                event = self._events.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            if event is not None:
+                return event
+        # Queued deltas are covered by the snapshot. A delta queued after
+        # the drain may be sent again, which is harmless since deltas carry
+        # absolute values
+        self._drain()
+        snapshot = self.broadcaster.get_snapshot(timeout)
+        if snapshot is None:
+            return None
+        self._resync.clear()
+        return (SNAPSHOT_EVENT, snapshot)
+
+    def _drain(self):
+        try:
+            while True:
+                self._events.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class _Broadcaster(object):
+    """
+    Recomputes the analysis of a filter combination when the metrics version
+    moves and fans the delta out to the subscribers
+    """
+
+    def __init__(self, key, compute, live_settings):
+        self.key = key
+        self._compute = compute
+        self._poll_seconds = live_settings["POLL_SECONDS"]
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="dashboard-live-%s" % key)
+        self._thread.start()
+
+    def add(self, subscriber):
+        with self._lock:
+            self._subscribers.add(subscriber)
+
+    def remove(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def stop(self):
+        self._stopped.set()
+
+    def get_snapshot(self, timeout):
+        """
+        Function to get the last computed analysis
+        Args:
+            timeout - seconds to wait for the first computation
+        Returns:
+            snapshot, None if it isn't computed yet
+        """
+        if not self._snapshot_ready.wait(timeout):
+            return None
+        with self._lock:
+            return self._snapshot
+
+    def _run(self):
+        version = object()
+        try:
+            while not self._stopped.is_set():
+                # Replaces connections broken by an earlier error
+                close_old_connections()
+                try:
+                    current_version = get_metrics_version()
+                except Exception as err:
+                    logger.error("Error while polling the metrics version, "
+                                 "Error: %s, Stack: %s"
+                                 % (str(err), format_exc()))
+                else:
+                    if current_version != version:
+                        version = current_version
+                        self._refresh()
+                self._stopped.wait(self._poll_seconds)
+        finally:
+            # The broadcaster thread owns its own DB connections
+            connections.close_all()
+
+    def _refresh(self):
+        """
+        Function to recompute the analysis and publish the delta
+        """
+        try:
+            snapshot = _to_snapshot(self._compute())
+        except Exception as err:
+            logger.error("Error while recomputing live analysis of %s, "
+                         "Error: %s, Stack: %s"
+                         % (self.key, str(err), format_exc()))
+            return
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = snapshot
+            subscribers = list(self._subscribers)
+        self._snapshot_ready.set()
+        if previous is None:
+            return
+        delta = _get_delta(previous, snapshot)
+        if not delta:
+            return
+        logger.debug("Publishing live delta of %s to %s clients: %s"
+                     % (self.key, len(subscribers), str(delta)))
+        for subscriber in subscribers:
+            subscriber.offer((DELTA_EVENT, delta))
+
+
+def _to_snapshot(analysis):
+    """
+    Function to convert the analysis to a snapshot with the departments
+    keyed by their id
+    Args:
+        analysis - output of views._get_departments_analysis
+    Returns:
+        snapshot dict
+    """
+    snapshot = dict(analysis)
+    snapshot["departments"] = dict(
+        (str(dept["department_id"]), dept) for dept in analysis["departments"])
+    return snapshot
+
+def _get_delta(previous, current):
+    """
+    Function to get the values which changed between two snapshots
+    Args:
+        previous - previous snapshot
+        current - current snapshot
+    Returns:
+        delta dict, empty when nothing changed
+    """
+    delta = {}
+    for section in ("objectives_on_track", "objectives_updated_recently"):
+        changed = _get_changed_values(previous.get(section, {}),
+                                      current.get(section, {}))
+        if changed:
+            delta[section] = changed
+    departments = {}
+    for dept_id, dept in current["departments"].items():
+        changed = _get_changed_values(
+                  previous["departments"].get(dept_id, {}), dept)
+        if changed:
+            departments[dept_id] = changed
+    for dept_id in previous["departments"]:
+        if dept_id not in current["departments"]:
+            departments[dept_id] = None
+    if departments:
+        delta["departments"] = departments
+    return delta
+
+def _get_changed_values(previous, current):
+    """
+    Function to get the keys of a dict whose values changed
+    Args:
+        previous - previous dict
+        current - current dict
+    Returns:
+        dict of the changed keys and their current values
+    """
+    return dict((key, value) for key, value in current.items()
+                if previous.get(key) != value)
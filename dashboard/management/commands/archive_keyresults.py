@@ -0,0 +1,78 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Management command which moves the key results older than the archival
+# horizon to the archive table in batches, leaving per objective, per day
+# summaries behind. Each batch is its own short transaction, so the command
+# can be stopped and rerun at any time. Every shard is archived in turn.
+#
+# Sample usage
+# python manage.py archive_keyresults
+# python manage.py archive_keyresults --horizon-days 365 --batch-size 500 \
+#     --pause 0.1
+from time import sleep, time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.archive import (archive_keyresults_batch, get_archive_cutoff,
+                               get_archive_settings)
+from dashboard.models import KeyResults
+from dashboard.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = ("Archive the key results older than the archival horizon in "
+            "batches, keeping per objective, per day summaries.")
+
+    def add_arguments(self, parser):
+        archive_settings = get_archive_settings()
+        parser.add_argument("--horizon-days", type=int,
+                            default=archive_settings["HORIZON_DAYS"],
+                            help="Archive key results last updated more "
+                                 "than this many days ago")
+        parser.add_argument("--batch-size", type=int,
+                            default=archive_settings["BATCH_SIZE"],
+                            help="Key results moved per transaction")
+        parser.add_argument("--pause", type=float, default=0,
+                            help="Seconds to sleep between batches")
+        parser.add_argument("--max-batches", type=int, default=None,
+                            help="Stop after this many batches")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report how many key results would "
+                                 "be archived")
+
+    def handle(self, *args, **options):
+        if options["horizon_days"] < 0:
+            raise CommandError("--horizon-days can't be negative")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        cutoff = get_archive_cutoff(options["horizon_days"])
+        if options["dry_run"]:
+            for using in get_shards():
+                pending = KeyResults.objects.using(using).filter(
+                          updated_date__lt=cutoff).count()
+                self.stdout.write("%s: %s key results updated before %s "
+                                  "would be archived"
+                                  % (using, pending, cutoff))
+            return
+        started = time()
+        total = batches = 0
+        for using in get_shards():
+            while options["max_batches"] is None or \
+                    batches < options["max_batches"]:
+                archived = archive_keyresults_batch(cutoff,
+                                                    options["batch_size"],
+                                                    using)
+                if not archived:
+                    break
+                batches += 1
+                total += archived
+                self.stdout.write("Batch %s: archived %s key results on %s"
+                                  % (batches, archived, using))
+                if options["pause"]:
+                    sleep(options["pause"])
+        self.stdout.write(self.style.SUCCESS(
+            "Archived %s key results updated before %s in %s batches, "
+            "%.2fs" % (total, cutoff, batches, time() - started)))
@@ -0,0 +1,166 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Management command which fills the status codes, the integer surrogate
+# keys and the objective surrogate keys of the key results added by
+# migration 0004 in batches, see dashboard/compact.py, ahead of migrations
+# 0006 and 0007, and corrects the status codes which went out of step with
+# the status. Each batch is its own short transaction and filled rows are skipped, so the
+# command can be stopped and rerun at any time. Every shard is filled in
+# turn. The size of the tables and their indexes is reported before and
+# after.
+#
+# Sample usage
+# python manage.py compact_schema --sizes-only
+# python manage.py compact_schema --batch-size 1000 --pause 0.1
+from time import sleep, time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.compact import (SURROGATE_FOREIGN_KEYS, SURROGATE_KEY_MODELS,
+                               backfill_status_codes_batch,
+                               backfill_surrogate_foreign_keys_batch,
+                               backfill_surrogate_keys_batch,
+                               get_compact_settings, get_table_sizes,
+                               resync_status_codes_batch)
+from dashboard.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = ("Fill the key result status codes and the integer surrogate keys "
+            "in batches and report the table and index sizes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int,
+                            default=get_compact_settings()["BATCH_SIZE"],
+                            help="Rows updated per transaction")
+        parser.add_argument("--pause", type=float, default=0,
+                            help="Seconds to sleep between batches")
+        parser.add_argument("--max-batches", type=int, default=None,
+                            help="Stop after this many batches")
+        parser.add_argument("--sizes-only", action="store_true",
+                            help="Only report the table and index sizes")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        sizes_before = dict((using, get_table_sizes(using))
+                            for using in get_shards())
+        if options["sizes_only"]:
+            self._write_sizes(sizes_before)
+            return
+        self.started = time()
+        self.batches = 0
+        self.options = options
+        for using in get_shards():
+            self._run_batches("status codes", using,
+                              lambda: backfill_status_codes_batch(
+                                      options["batch_size"], using))
+            self._resync_status_codes(using)
+            for model in SURROGATE_KEY_MODELS:
+                self._run_batches("%s surrogate keys" % model._meta.db_table,
+                                  using,
+                                  lambda: backfill_surrogate_keys_batch(
+                                          model, options["batch_size"], using))
+            for model, column, related_model, sid_column in \
+                    SURROGATE_FOREIGN_KEYS:
+                self._run_batches("%s.%s" % (model._meta.db_table, sid_column),
+                                  using,
+                                  lambda: backfill_surrogate_foreign_keys_batch(
+                                          model, column, related_model,
+                                          sid_column, options["batch_size"],
+                                          using))
+        self.stdout.write(self.style.SUCCESS(
+            "Filled %s batches, %.2fs" % (self.batches, time() - self.started)))
+        self._write_sizes(sizes_before, dict((using, get_table_sizes(using))
+                                             for using in get_shards()))
+
+    def _run_batches(self, name, using, run_batch):
+        """
+        Function to run the batches of one backfill until it is done or
+        --max-batches is reached
+        Args:
+            name - name of the backfill for the output
+            using - database alias of the shard
+            run_batch - function without args which fills one batch and
+                        returns the no of rows filled
+        """
+        total = 0
+        while self._can_run_batch():
+            filled = run_batch()
+            if not filled:
+                break
+            self.batches += 1
+            total += filled
+            if self.options["pause"]:
+                sleep(self.options["pause"])
+        if total:
+            self.stdout.write("%s: filled %s on %s" % (name, total, using))
+
+    def _resync_status_codes(self, using):
+        """
+        Function to check every key result of a shard in batches and correct
+        the status codes which don't match the status
+        Args:
+            using - database alias of the shard
+        """
+        total = 0
+        after_pk = None
+        while self._can_run_batch():
+            corrected, after_pk = resync_status_codes_batch(
+                                  self.options["batch_size"], after_pk, using)
+            self.batches += 1
+            total += corrected
+            if after_pk is None:
+                break
+            if self.options["pause"]:
+                sleep(self.options["pause"])
+        if total:
+            self.stdout.write("status codes: corrected %s on %s"
+                              % (total, using))
+
+    def _can_run_batch(self):
+        """
+        Function to check if --max-batches allows one more batch
+        Returns:
+            True if another batch can run
+        """
+        return self.options["max_batches"] is None or \
+               self.batches < self.options["max_batches"]
+
+    def _write_sizes(self, sizes_before, sizes_after=None):
+        """
+        Function to print the table and index sizes of every shard
+        Args:
+            sizes_before - {using: get_table_sizes(using)} before the backfill
+            sizes_after - same after the backfill, None to only print before
+        """
+        header = "%-10s %-12s %12s %12s" % ("shard", "table", "table kB",
+                                            "indexes kB")
+        if sizes_after is not None:
+            header += " %14s %14s" % ("after table kB", "after index kB")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for using, sizes in sizes_before.items():
+            for table, (table_size, index_size) in sizes.items():
+                line = "%-10s %-12s %12s %12s" % (using, table,
+                                                  _format_kb(table_size),
+                                                  _format_kb(index_size))
+                if sizes_after is not None:
+                    after_table, after_index = sizes_after[using][table]
+                    line += " %14s %14s" % (_format_kb(after_table),
+                                            _format_kb(after_index))
+                self.stdout.write(line)
+
+
+def _format_kb(size):
+    """
+    Function to format a size in bytes as kB
+    Args:
+        size - no of bytes, None when not known
+    Returns:
+        string
+    """
+    return "n/a" if size is None else "%.1f" % (size / 1024.0)
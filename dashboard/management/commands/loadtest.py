@@ -0,0 +1,339 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Management command which drives `analytical_dashboard.wsgi.application`
+# in-process with a concurrent mix of `departments` and `teams` requests and
+# reports throughput, latency percentiles and error rate per endpoint.
+# No server or network is involved, requests are handed straight to the
+# WSGI callable from a pool of worker threads.
+#
+# Sample usage
+# python manage.py loadtest --requests 500 --concurrency 8
+# python manage.py loadtest --duration 30 --concurrency 16 --teams-ratio 0.5 \
+#     --on-track-filters "1 weeks,2 weeks,3 months" \
+#     --recently-upd-filters "2 weeks,6 months"
+import logging
+import random
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from json import dumps
+from time import perf_counter
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.models import Department
+from dashboard.sharding import scatter
+from dashboard.views import ERROR_PAGE_MARKER
+
+DEPARTMENTS_URL = "/dashboard/departments"
+TEAMS_URL = "/dashboard/teams"
+
+
+class Command(BaseCommand):
+    help = ("Drive the WSGI application in-process with a concurrent mix of "
+            "departments and teams requests and report throughput, latency "
+            "percentiles and error rate per endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Total no of requests to send "
+                                 "(ignored when --duration is given)")
+        parser.add_argument("--duration", type=float, default=None,
+                            help="Run for this many seconds instead of a "
+                                 "fixed no of requests")
+        parser.add_argument("--concurrency", type=int, default=4,
+                            help="No of concurrent client threads")
+        parser.add_argument("--warmup", type=int, default=0,
+                            help="Requests sent before measuring starts")
+        parser.add_argument("--teams-ratio", type=float, default=0.3,
+                            help="Fraction of requests hitting the teams "
+                                 "endpoint, the rest hit departments")
+        parser.add_argument("--on-track-filters", default="none,1 weeks,"
+                            "2 weeks,1 months",
+                            help="Comma separated `on_track_filter` values, "
+                                 "`none` sends no parameter")
+        parser.add_argument("--recently-upd-filters", default="none,2 weeks,"
+                            "4 weeks,3 months",
+                            help="Comma separated `recently_upd_filter` "
+                                 "values, `none` sends no parameter")
+        parser.add_argument("--departments", default=None,
+                            help="Comma separated department names for the "
+                                 "teams endpoint; default is all departments")
+        parser.add_argument("--seed", type=int, default=None,
+                            help="Random seed for a reproducible request mix")
+        parser.add_argument("--log-level", default="WARNING",
+                            help="Level of the `dashboard` logger while the "
+                                 "load runs")
+        parser.add_argument("--json", action="store_true",
+                            help="Print the report as json")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1")
+        if not 0 <= options["teams_ratio"] <= 1:
+            raise CommandError("--teams-ratio must be between 0 and 1")
+        # Import here so that the settings are configured by manage.py first
+        from analytical_dashboard.wsgi import application
+
+        department_names = _split_values(options["departments"]) \
+                           if options["departments"] else \
+                           [name for names in scatter(_get_department_names)
+                            for name in names]
+        if options["teams_ratio"] and not department_names:
+            raise CommandError("No departments found for the teams endpoint")
+        plan = _RequestPlan(
+            _split_values(options["on_track_filters"]),
+            _split_values(options["recently_upd_filters"]),
+            department_names, options["teams_ratio"], options["seed"])
+
+        dashboard_logger = logging.getLogger("dashboard")
+        previous_level = dashboard_logger.level
+        dashboard_logger.setLevel(options["log_level"].upper())
+        try:
+            if options["warmup"]:
+                _run_load(application, plan, options["concurrency"],
+                          total=options["warmup"])
+            results, elapsed = _run_load(application, plan,
+                                         options["concurrency"],
+                                         total=options["requests"],
+                                         duration=options["duration"])
+        finally:
+            dashboard_logger.setLevel(previous_level)
+
+        report = _build_report(results, elapsed, options["concurrency"])
+        if options["json"]:
+            self.stdout.write(dumps(report, indent=2))
+        else:
+            self._write_report(report)
+
+    def _write_report(self, report):
+        """
+        Function to print the report as a table
+        Args:
+            report - report dict from `_build_report`
+        """
+        self.stdout.write("Concurrency: %s, elapsed: %.2fs, requests: %s, "
+                          "throughput: %.1f req/s"
+                          % (report["concurrency"], report["elapsed"],
+                             report["requests"], report["throughput"]))
+        header = "%-14s %8s %10s %9s %9s %9s %9s %8s" % (
+                 "endpoint", "requests", "req/s", "mean ms", "p50 ms",
+                 "p95 ms", "p99 ms", "errors")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, stats in report["endpoints"].items():
+            self.stdout.write("%-14s %8s %10.1f %9.1f %9.1f %9.1f %9.1f %7.1f%%"
+                              % (name, stats["requests"],
+                                 stats["throughput"], stats["mean_ms"],
+                                 stats["p50_ms"], stats["p95_ms"],
+                                 stats["p99_ms"], stats["error_rate"]))
+
+
+class _RequestPlan(object):
+    """
+    Thread safe generator of the request mix. Each call to `next_request`
+    returns the endpoint name and the WSGI path and query string.
+    """
+
+    def __init__(self, on_track_filters, recently_upd_filters,
+                 department_names, teams_ratio, seed=None):
+        self._on_track_filters = on_track_filters or ["none"]
+        self._recently_upd_filters = recently_upd_filters or ["none"]
+        self._department_names = department_names
+        self._teams_ratio = teams_ratio
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_request(self):
+        """
+        Function to pick the next request of the mix
+        Returns:
+            (endpoint, path, query_string)
+            endpoint - "departments" or "teams"
+        """
+        with self._lock:
+            if self._random.random() < self._teams_ratio:
+                query = {"department_name": self._random.choice(
+                                            self._department_names)}
+                return ("teams", TEAMS_URL, urlencode(query))
+            query = {}
+            on_track_filter = self._random.choice(self._on_track_filters)
+            if on_track_filter.lower() != "none":
+                query["on_track_filter"] = on_track_filter
+            recently_upd_filter = self._random.choice(
+                                  self._recently_upd_filters)
+            if recently_upd_filter.lower() != "none":
+                query["recently_upd_filter"] = recently_upd_filter
+            return ("departments", DEPARTMENTS_URL, urlencode(query))
+
+
+def _get_department_names(using):
+    """
+    Function to get the department names of a shard
+    Args:
+        using - database alias of the shard
+    Returns:
+        list of department names
+    """
+    return list(Department.objects.using(using).values_list("name",
+                                                            flat=True))
+
+def _split_values(values):
+    """
+    Function to split a comma separated option value
+    Args:
+        values - comma separated string
+    Returns:
+        list of stripped non empty values
+    """
+    return [value.strip() for value in values.split(",") if value.strip()]
+
+
+def _call_application(application, path, query_string):
+    """
+    Function to send one GET request to the WSGI application
+    Args:
+        application - WSGI callable
+        path - request path
+        query_string - url encoded query string
+    Returns:
+        (status_code, ok)
+    """
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "wsgi.input": BytesIO(),
+    }
+    setup_testing_defaults(environ)
+    status_holder = []
+
+    def start_response(status, headers, exc_info=None):
+        status_holder.append(int(status.split(" ", 1)[0]))
+
+    body = application(environ, start_response)
+    try:
+        content = b"".join(body)
+    finally:
+        # Fires `request_finished`, which releases the DB connection
+        if hasattr(body, "close"):
+            body.close()
+    status_code = status_holder[0] if status_holder else 0
+    ok = status_code < 400 and ERROR_PAGE_MARKER not in content
+    return (status_code, ok)
+
+
+def _run_load(application, plan, concurrency, total=None, duration=None):
+    """
+    Function to run the requests of the plan over `concurrency` threads
+    Args:
+        application - WSGI callable
+        plan - `_RequestPlan`
+        concurrency - no of client threads
+        total - total no of requests, used when duration is None
+        duration - seconds to run for
+    Returns:
+        results - list of (endpoint, latency_seconds, ok)
+        elapsed - wall clock seconds of the run
+    """
+    results = []
+    results_lock = threading.Lock()
+    counter = {"sent": 0}
+    started = perf_counter()
+    deadline = started + duration if duration else None
+
+    def claim():
+        with results_lock:
+            if deadline is not None:
+                return perf_counter() < deadline
+            if counter["sent"] >= total:
+                return False
+            counter["sent"] += 1
+            return True
+
+    def worker():
+        while claim():
+            endpoint, path, query_string = plan.next_request()
+            request_started = perf_counter()
+            try:
+                _, ok = _call_application(application, path, query_string)
+            except Exception:
+                ok = False
+            latency = perf_counter() - request_started
+            with results_lock:
+                results.append((endpoint, latency, ok))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(worker) for _ in range(concurrency)]
+        for future in futures:
+            future.result()
+    return (results, perf_counter() - started)
+
+
+def _percentile(sorted_values, percent):
+    """
+    Function to get the nearest rank percentile of sorted values
+    Args:
+        sorted_values - ascending list of values
+        percent - percentile between 0 and 100
+    Returns:
+        the percentile value, 0 for an empty list
+    """
+    if not sorted_values:
+        return 0
+    rank = max(int(round(percent / 100.0 * len(sorted_values))), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _build_report(results, elapsed, concurrency):
+    """
+    Function to aggregate the results per endpoint
+    Args:
+        results - list of (endpoint, latency_seconds, ok)
+        elapsed - wall clock seconds of the run
+        concurrency - no of client threads
+    Returns:
+        {
+            "concurrency": 4,
+            "elapsed": 2.5,
+            "requests": 200,
+            "throughput": 80.0,
+            "endpoints": {
+                "departments": {"requests": 140, "throughput": 56.0,
+                                "mean_ms": 40.1, "p50_ms": 35.2,
+                                "p95_ms": 80.3, "p99_ms": 120.9,
+                                "error_rate": 0.0},
+                ...
+            }
+        }
+    """
+    by_endpoint = {}
+    for endpoint, latency, ok in results:
+        by_endpoint.setdefault(endpoint, []).append((latency, ok))
+    endpoints = {}
+    for endpoint in sorted(by_endpoint):
+        samples = by_endpoint[endpoint]
+        latencies = sorted(latency * 1000 for latency, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "throughput": round(len(samples) / elapsed, 2) if elapsed else 0,
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "p50_ms": round(_percentile(latencies, 50), 2),
+            "p95_ms": round(_percentile(latencies, 95), 2),
+            "p99_ms": round(_percentile(latencies, 99), 2),
+            "error_rate": round(errors / len(samples) * 100, 2),
+        }
+    return {
+        "concurrency": concurrency,
+        "elapsed": round(elapsed, 3),
+        "requests": len(results),
+        "throughput": round(len(results) / elapsed, 2) if elapsed else 0,
+        "endpoints": endpoints,
+    }
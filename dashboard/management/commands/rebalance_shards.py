@@ -0,0 +1,70 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Management command which moves every department stored on a shard it
+# doesn't belong on to its shard, see dashboard/rebalance.py. Run it after
+# migrating a new shard, which is seeded with every sample department, and
+# after changing settings.DASHBOARD_SHARDS. Each department is moved in its
+# own transactions, so the command can be stopped and rerun at any time.
+#
+# Sample usage
+# python manage.py rebalance_shards --dry-run
+# python manage.py rebalance_shards
+# Drain a database which was removed from DASHBOARD_SHARDS
+# python manage.py rebalance_shards --source old_shard
+from time import sleep, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from dashboard.rebalance import (get_misplaced_departments,
+                                 get_rebalance_settings, move_department)
+from dashboard.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = ("Move the departments stored on a shard they don't belong on, "
+            "with their teams, users, objectives and key results, to their "
+            "shard.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", action="append", default=None,
+                            help="Database alias to move the departments "
+                                 "off, may be repeated; default every shard")
+        parser.add_argument("--batch-size", type=int,
+                            default=get_rebalance_settings()["BATCH_SIZE"],
+                            help="Rows read per query while copying")
+        parser.add_argument("--pause", type=float, default=0,
+                            help="Seconds to sleep between departments")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report the departments which would "
+                                 "be moved")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        sources = options["source"] or get_shards()
+        for using in sources:
+            if using not in connections.databases:
+                raise CommandError("Unknown database alias %s" % using)
+        started = time()
+        misplaced = get_misplaced_departments(sources)
+        for department_id, source, target in misplaced:
+            if options["dry_run"]:
+                self.stdout.write("Department %s would be moved from %s to %s"
+                                  % (department_id, source, target))
+                continue
+            copied = move_department(department_id, source, target,
+                                     options["batch_size"])
+            self.stdout.write("Moved department %s from %s to %s: %s"
+                              % (department_id, source, target,
+                                 ", ".join("%s %s" % (count, table)
+                                           for table, count in copied.items())))
+            if options["pause"]:
+                sleep(options["pause"])
+        if options["dry_run"]:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            "Moved %s departments, %.2fs" % (len(misplaced), time() - started)))
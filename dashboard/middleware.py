@@ -0,0 +1,170 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# This module has the middlewares of the dashboard app
+#
+# CompressionMiddleware
+# Compresses responses with the best encoding the client accepts:
+# brotli(`br`) when the `brotli` package is installed, else gzip. Streamed
+# content is flushed after every chunk, so it isn't held back by the
+# compressor.
+# Enable it in settings.MIDDLEWARE before any middleware which reads or
+# writes the response body
+# 'dashboard.middleware.CompressionMiddleware'
+#
+# WarmUpMiddleware
+# Starts the warm-up of the process(see dashboard/warmup.py) in the
+# background on the first request, for servers without a warm-up hook like
+# runserver. It is only used when DASHBOARD_WARMUP["ON_FIRST_REQUEST"] is
+# set, gunicorn warms its workers up before they accept connections.
+# 'dashboard.middleware.WarmUpMiddleware'
+import re
+import zlib
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from .warmup import get_warmup_settings, start_warm_up
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# It's not worth compressing really short responses
+MIN_COMPRESS_LENGTH = 200
+# Content types which must reach the client as soon as they are written
+UNBUFFERED_CONTENT_TYPES = ("text/event-stream",)
+re_accept_encoding = re.compile(r"\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?")
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress content with brotli or gzip, whichever the client prefers and
+    the server supports. Set the Vary header accordingly, so that caches
+    will base their storage on the Accept-Encoding header.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and \
+                len(response.content) < MIN_COMPRESS_LENGTH:
+            return response
+        # Avoid compressing if we've already got a content-encoding
+        if response.has_header("Content-Encoding"):
+            return response
+        content_type = response.get("Content-Type", "")
+        if content_type.split(";")[0].strip() in UNBUFFERED_CONTENT_TYPES:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = _get_encoding(
+                   request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            # The compressed size is not known until the content is streamed
+            response.streaming_content = _compress_sequence(
+                                         response.streaming_content, encoding)
+            del response["Content-Length"]
+        else:
+            compressed_content = _compress_string(response.content, encoding)
+            # Return the compressed content only if it's actually shorter
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response["Content-Length"] = str(len(response.content))
+
+        # A strong ETag no longer matches the encoded body
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+
+class WarmUpMiddleware(MiddlewareMixin):
+    """
+    Start the warm-up of the process on its first request
+    """
+
+    def __init__(self, get_response=None):
+        warmup_settings = get_warmup_settings()
+        if not warmup_settings["ENABLED"] or \
+                not warmup_settings["ON_FIRST_REQUEST"]:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        start_warm_up()
+
+
+def _get_encoding(accept_encoding):
+    """
+    Function to negotiate the content encoding
+    Args:
+        accept_encoding - value of the Accept-Encoding request header
+    Returns:
+        "br", "gzip" or None if the client accepts neither
+    """
+    qualities = {}
+    for value in accept_encoding.split(","):
+        match = re_accept_encoding.match(value)
+        if not match or not match.group(1):
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        qualities[match.group(1).lower()] = quality
+    wildcard = qualities.get("*", 0)
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = None
+    best_quality = 0
+    for encoding in supported:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compress_string(content, encoding):
+    """
+    Function to compress the whole content
+    Args:
+        content - bytes to compress
+        encoding - "br" or "gzip"
+    Returns:
+        compressed bytes
+    """
+    if encoding == "br":
+        return brotli.compress(content, quality=5)
+    return compress_string(content)
+
+
+def _compress_sequence(sequence, encoding):
+    """
+    Function to compress streamed content chunk by chunk. The compressor is
+    flushed after every chunk, so that each chunk reaches the client as
+    soon as it is streamed
+    Args:
+        sequence - iterable of bytes
+        encoding - "br" or "gzip"
+    Returns:
+        generator of compressed bytes
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        for item in sequence:
+            yield compressor.process(item) + compressor.flush()
+        yield compressor.finish()
+        return
+    # 16 + MAX_WBITS writes the gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for item in sequence:
+        yield compressor.compress(item) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
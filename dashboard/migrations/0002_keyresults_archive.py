@@ -0,0 +1,48 @@
+# Generated by Django 3.0 on 2026-10-19 10:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='keyresults',
+            name='updated_date',
+            field=models.DateField(db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='KeyResultsArchive',
+            fields=[
+                ('keyresult_id', models.CharField(max_length=12, primary_key=True, serialize=False)),
+                ('keyresult_text', models.CharField(max_length=100, null=True)),
+                ('status', models.CharField(choices=[('Pending', 'PENDING'), ('Complete', 'COMPLETE')], max_length=12, null=True)),
+                ('due_date', models.DateField(null=True)),
+                ('updated_date', models.DateField(null=True)),
+                ('archived_date', models.DateField(auto_now_add=True)),
+                ('objective_id', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='dashboard.Objectives')),
+            ],
+            options={
+                'db_table': 'keyresults_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='KeyResultsSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_date', models.DateField(db_index=True)),
+                ('keyresults_count', models.IntegerField(default=0)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('objective_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.Objectives')),
+            ],
+            options={
+                'db_table': 'keyresults_summary',
+                'unique_together': {('objective_id', 'updated_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0 on 2026-10-19 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_keyresults_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='keyresults',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'PENDING'), ('Complete', 'COMPLETE')], db_index=True, max_length=12, null=True),
+        ),
+    ]
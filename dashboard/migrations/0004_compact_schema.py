@@ -0,0 +1,78 @@
+# Generated by Django 3.0 on 2026-10-19 11:10
+#
+# Step 1 of the compact schema migration, see dashboard/compact.py
+#
+# The columns are added empty, the `compact_schema` command fills them in
+# batches. On PostgreSQL a sequence per table feeds the surrogate keys of
+# the rows inserted from now on, raw SQL inserts included, and of the rows
+# numbered by the command.
+
+from django.db import migrations, models
+
+SURROGATE_KEY_TABLES = ("department", "teams", "users", "objectives",
+                        "keyresults")
+
+
+def create_sid_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in SURROGATE_KEY_TABLES:
+        sequence = "%s_sid_seq" % table
+        schema_editor.execute("CREATE SEQUENCE %s OWNED BY %s.sid"
+                              % (sequence, table))
+        schema_editor.execute("ALTER TABLE %s ALTER COLUMN sid SET DEFAULT "
+                              "nextval('%s')" % (table, sequence))
+
+def drop_sid_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in SURROGATE_KEY_TABLES:
+        schema_editor.execute("ALTER TABLE %s ALTER COLUMN sid DROP DEFAULT"
+                              % table)
+        schema_editor.execute("DROP SEQUENCE %s_sid_seq" % table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_keyresults_status_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='department',
+            name='sid',
+            field=models.IntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='keyresults',
+            name='objective_sid',
+            field=models.IntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='keyresults',
+            name='sid',
+            field=models.IntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='keyresults',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='objectives',
+            name='sid',
+            field=models.IntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='teams',
+            name='sid',
+            field=models.IntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='users',
+            name='sid',
+            field=models.IntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(create_sid_sequences, drop_sid_sequences),
+    ]
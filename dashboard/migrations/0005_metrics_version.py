@@ -0,0 +1,30 @@
+# Generated by Django 3.0 on 2026-10-19 11:26
+
+from django.db import migrations, models
+
+
+def create_version_row(apps, schema_editor):
+    # The row of the shard bumped by dashboard.live.bump_metrics_version
+    MetricsVersion = apps.get_model("dashboard", "MetricsVersion")
+    MetricsVersion.objects.using(schema_editor.connection.alias).create(
+        pk=1, version=0)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_compact_schema'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricsVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'metrics_version',
+            },
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
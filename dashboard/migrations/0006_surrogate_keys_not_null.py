@@ -0,0 +1,95 @@
+# Step 4 of the compact schema migration, see dashboard/compact.py
+#
+# Every row has its surrogate key once the `compact_schema` command has run,
+# and the keys become NOT NULL. The few rows written since the command ran
+# are filled here, more than a batch per table stops the migration: run the
+# command first, in batches outside of the migration's transaction.
+
+from django.db import migrations, models
+
+SURROGATE_KEY_MODELS = ("Department", "Teams", "Users", "Objectives",
+                        "KeyResults")
+# Rows left which are filled by the migration itself, per table
+BATCH_SIZE = 1000
+
+
+class BackfillIncomplete(Exception):
+    """
+    Raised when too many rows are left to fill within the migration
+    """
+
+
+def check_backfill(apps, schema_editor):
+    using = schema_editor.connection.alias
+    for model_name in SURROGATE_KEY_MODELS:
+        model = apps.get_model("dashboard", model_name)
+        left = list(model.objects.using(using).filter(
+                    sid__isnull=True).values_list("pk", flat=True)[
+                    :BATCH_SIZE + 1])
+        _check_left(model._meta.db_table, "sid", len(left), using)
+        for pk in left:
+            _number_row(schema_editor, model, pk)
+    keyresults = apps.get_model("dashboard", "KeyResults").objects.using(
+                 using).filter(objective_sid__isnull=True,
+                               objective_id__isnull=False)
+    left = list(keyresults.values_list("pk", "objective_id__sid")[
+                :BATCH_SIZE + 1])
+    _check_left("keyresults", "objective_sid", len(left), using)
+    for pk, sid in left:
+        keyresults.filter(pk=pk).update(objective_sid=sid)
+
+def _check_left(table, column, left, using):
+    if left > BATCH_SIZE:
+        raise BackfillIncomplete(
+            "More than %s rows of %s.%s are not filled on %s, run "
+            "`python manage.py compact_schema` before migrating"
+            % (BATCH_SIZE, table, column, using))
+
+def _number_row(schema_editor, model, pk):
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(model._meta.db_table)
+    if connection.vendor == "postgresql":
+        sid = "nextval('%s_sid_seq')" % model._meta.db_table
+    else:
+        sid = "(SELECT COALESCE(MAX(sid), 0) + 1 FROM %s)" % table
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE %s SET sid = %s WHERE %s = %%s"
+                       % (table, sid,
+                          connection.ops.quote_name(model._meta.pk.column)),
+                       [pk])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_metrics_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_backfill, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='department',
+            name='sid',
+            field=models.IntegerField(editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='keyresults',
+            name='sid',
+            field=models.IntegerField(editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='objectives',
+            name='sid',
+            field=models.IntegerField(editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='teams',
+            name='sid',
+            field=models.IntegerField(editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='users',
+            name='sid',
+            field=models.IntegerField(editable=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Step 5 of the compact schema migration, see dashboard/compact.py
+#
+# The key results reference their objective by its surrogate key, the string
+# foreign key column and its index are dropped. Not atomic, so that each
+# schema change holds its table lock on its own.
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def restore_objective_ids(apps, schema_editor):
+    using = schema_editor.connection.alias
+    keyresults = apps.get_model("dashboard", "KeyResults").objects.using(using)
+    while True:
+        batch = list(keyresults.filter(
+                     objective_id__isnull=True, objective_sid__isnull=False
+                     ).order_by("pk").values_list(
+                     "pk", "objective_sid")[:BATCH_SIZE])
+        if not batch:
+            break
+        objectives = dict(apps.get_model("dashboard", "Objectives").objects.using(
+                          using).filter(sid__in=[sid for _, sid in batch]
+                          ).values_list("sid", "pk"))
+        keyresults.model.objects.using(using).bulk_update(
+            [keyresults.model(pk=pk, objective_id_id=objectives[sid])
+             for pk, sid in batch], ["objective_id"])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('dashboard', '0006_surrogate_keys_not_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_objective_ids),
+        migrations.RemoveField(
+            model_name='keyresults',
+            name='objective_id',
+        ),
+        migrations.AlterField(
+            model_name='keyresults',
+            name='objective_sid',
+            field=models.IntegerField(db_column='objective_sid', db_index=True, editable=False, null=True),
+        ),
+        migrations.RenameField(
+            model_name='keyresults',
+            old_name='objective_sid',
+            new_name='objective_id',
+        ),
+        migrations.AlterField(
+            model_name='keyresults',
+            name='objective_id',
+            field=models.ForeignKey(db_column='objective_sid', null=True, on_delete=django.db.models.deletion.CASCADE, to='dashboard.Objectives', to_field='sid'),
+        ),
+    ]
@@ -13,48 +13,248 @@
 # <model_name>.objects.filter(<filter_condition>).delete()
 # Create object
 # <model_name>.objects.create(**fields)
-from django.db import models
+# The object is created on the shard of its department(see
+# dashboard/routers.py), Users, Objectives and KeyResults through their
+# related object, e.g. Users.objects.create(team_id=team)
+from django.db import connection, connections, models
+
+# Compact status code of the key results used by the aggregations. Any
+# status other than complete counts as pending
+PENDING_CODE = 0
+COMPLETE_CODE = 1
 
 # Create your models here.
 
-class Department(models.Model):
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet whose `create` lets the database router place the new object
+    by the object itself, `QuerySet.create` gives the router no instance
+    """
+
+    def create(self, **kwargs):
+        obj = self.model(**kwargs)
+        self._for_write = True
+        # The alias of `.using()` wins, else the router decides
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False):
+        if not issubclass(self.model, SurrogateKeyModel) or \
+                connections[self.db].features.can_return_rows_from_bulk_insert:
+            return super().bulk_create(objs, batch_size, ignore_conflicts)
+        # Without a sequence the next surrogate key is read once per INSERT
+        # statement, and it isn't returned
+        objs = super().bulk_create(objs, 1, ignore_conflicts)
+        sids = dict(self.filter(pk__in=[obj.pk for obj in objs]).values_list(
+                    "pk", "sid"))
+        for obj in objs:
+            obj.sid = sids.get(obj.pk)
+        return objs
+
+# `sid` is the integer surrogate key of a row, assigned by the database on
+# insert: from the `<table>_sid_seq` sequence of the shard on PostgreSQL
+# (created by migration 0004) and after the highest key of the table
+# elsewhere, within the INSERT statement. The string keys are kept as the
+# natural keys. The key results reference their objective by its surrogate
+# key, see dashboard/compact.py
+
+class NextSurrogateKey(models.Expression):
+    """
+    Next surrogate key of a table, taken by the statement which writes it
+    """
+
+    def __init__(self, table):
+        super().__init__(output_field=models.IntegerField())
+        self.table = table
+
+    def as_sql(self, compiler, connection):
+        if connection.vendor == "postgresql":
+            return ("nextval(%s)", ["%s_sid_seq" % self.table])
+        # Without sequences, the statement holds the write lock of SQLite
+        return ("(SELECT COALESCE(MAX(sid), 0) + 1 FROM %s)"
+                % connection.ops.quote_name(self.table), [])
+
+class SurrogateKeyField(models.IntegerField):
+    """
+    Integer surrogate key assigned by the database on insert. It is read
+    back with the INSERT where the backend can return columns, else by
+    SurrogateKeyModel.save
+    """
+
+    @property
+    def db_returning(self):
+        return connection.features.can_return_columns_from_insert
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if value is not None:
+            return value
+        if add:
+            return NextSurrogateKey(model_instance._meta.db_table)
+        # A row loaded before it was numbered keeps the key it got since
+        return models.F(self.attname)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        # The migrations only see the integer column
+        return (name, "django.db.models.IntegerField", args, kwargs)
+
+class SurrogateKeyModel(models.Model):
+    """
+    Model with an integer surrogate key `sid`, assigned on insert
+    """
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.sid is None:
+            # Backends which can't return columns from an INSERT
+            self.sid = type(self)._base_manager.using(self._state.db).filter(
+                       pk=self.pk).values_list("sid", flat=True).get()
+
+    def assign_sid(self):
+        """
+        Function to number a row saved before it had a surrogate key, see
+        dashboard/compact.py
+        """
+        rows = type(self)._base_manager.using(self._state.db)
+        rows.filter(pk=self.pk, sid__isnull=True).update(
+            sid=NextSurrogateKey(self._meta.db_table))
+        self.sid = rows.filter(pk=self.pk).values_list("sid", flat=True).get()
+
+class Department(SurrogateKeyModel):
     department_id = models.CharField(primary_key=True ,max_length=15)
     name = models.CharField(max_length=15, null=True, unique=True)
     location = models.CharField(max_length=20, null=True)
     date_of_innaugration = models.DateField(null=True)
+    sid = SurrogateKeyField(unique=True, editable=False)
+    objects = ShardedQuerySet.as_manager()
     class Meta:
         db_table = "department"
 
-class Teams(models.Model):
+    def __str__(self):
+        return str(self.name)
+
+class Teams(SurrogateKeyModel):
     team_id = models.CharField(primary_key=True ,max_length=15)
     team_lead_id = models.ForeignKey('Users', on_delete=models.CASCADE, null=True)
     department_id = models.ForeignKey('Department', on_delete=models.CASCADE, null=True)
     average_pay = models.CharField(max_length=10, null=True)
+    sid = SurrogateKeyField(unique=True, editable=False)
+    objects = ShardedQuerySet.as_manager()
     class Meta:
         db_table = "teams"
+
+    def __str__(self):
+        return "Team %s" % self.team_id
         
-class Users(models.Model):
+class Users(SurrogateKeyModel):
     user_id = models.CharField(primary_key=True ,max_length=15)
     first_name = models.CharField(max_length=25, null=True)
     last_name = models.CharField(max_length=25, null=True)
     team_id = models.ForeignKey('Teams', on_delete=models.CASCADE, null=True)
+    sid = SurrogateKeyField(unique=True, editable=False)
+    objects = ShardedQuerySet.as_manager()
     class Meta:
         db_table = "users"
 
-class Objectives(models.Model):
+    def __str__(self):
+        return "%s %s" % (self.first_name, self.last_name)
+
+class Objectives(SurrogateKeyModel):
     objective_id = models.CharField(primary_key=True ,max_length=12)
     user_id = models.ForeignKey('Users', on_delete=models.CASCADE)
     objective_text = models.CharField(max_length=100, null=True)
+    sid = SurrogateKeyField(unique=True, editable=False)
+    objects = ShardedQuerySet.as_manager()
     class Meta:
         db_table = "objectives"
 
-class KeyResults(models.Model):
+    def __str__(self):
+        return str(self.objective_text)
+
+class KeyResults(SurrogateKeyModel):
     STATUSES = (("Pending", "PENDING"), ("Complete", "COMPLETE"))
+    keyresult_id = models.CharField(primary_key=True ,max_length=12)
+    objective_id = models.ForeignKey('Objectives', on_delete=models.CASCADE, null=True,
+                                     to_field="sid", db_column="objective_sid")
+    keyresult_text = models.CharField(max_length=100, null=True)
+    status =  models.CharField(max_length=12, choices=STATUSES, null=True, db_index=True)
+    due_date = models.DateField(null=True)
+    updated_date = models.DateField(null=True, db_index=True)
+    status_code = models.PositiveSmallIntegerField(null=True, db_index=True, editable=False)
+    sid = SurrogateKeyField(unique=True, editable=False)
+    objects = ShardedQuerySet.as_manager()
+    class Meta:
+        db_table = "keyresults"
+
+    def __str__(self):
+        return str(self.keyresult_text)
+
+    def save(self, *args, **kwargs):
+        if self.objective_id_id is None and \
+                self._meta.get_field("objective_id").is_cached(self) and \
+                self.objective_id is not None:
+            # Saved after the objective was assigned to it, or the objective
+            # predates its surrogate key
+            if self.objective_id.sid is None:
+                self.objective_id.assign_sid()
+            self.objective_id_id = self.objective_id.sid
+        # Keep the status code in step with the status
+        self.status_code = get_status_code(self.status)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {"status_code"}
+        super().save(*args, **kwargs)
+
+def get_status_code(status):
+    """
+    Function to get the compact code of a key result status
+    Args:
+        status - status string
+    Returns:
+        COMPLETE_CODE, PENDING_CODE or None when the status is None
+    """
+    if status is None:
+        return None
+    return COMPLETE_CODE if status == "Complete" else PENDING_CODE
+
+# Key results older than the archival horizon are moved out of `keyresults`
+# by the `archive_keyresults` command, see dashboard/archive.py
+
+class KeyResultsArchive(models.Model):
     keyresult_id = models.CharField(primary_key=True ,max_length=12)
     objective_id = models.ForeignKey('Objectives', on_delete=models.CASCADE, null=True)
     keyresult_text = models.CharField(max_length=100, null=True)
-    status =  models.CharField(max_length=12, choices=STATUSES, null=True)
+    status =  models.CharField(max_length=12, choices=KeyResults.STATUSES, null=True)
     due_date = models.DateField(null=True)
     updated_date = models.DateField(null=True)
+    archived_date = models.DateField(auto_now_add=True)
+    objects = ShardedQuerySet.as_manager()
+    class Meta:
+        db_table = "keyresults_archive"
+
+class KeyResultsSummary(models.Model):
+    """
+    Archived key results of an objective which were last updated on a day
+    """
+    objective_id = models.ForeignKey('Objectives', on_delete=models.CASCADE)
+    updated_date = models.DateField(db_index=True)
+    keyresults_count = models.IntegerField(default=0)
+    # Key results which are not complete
+    pending_count = models.IntegerField(default=0)
+    objects = ShardedQuerySet.as_manager()
+    class Meta:
+        db_table = "keyresults_summary"
+        unique_together = (("objective_id", "updated_date"),)
+
+class MetricsVersion(models.Model):
+    """
+    Version of the data behind the metrics, a row on every shard bumped by
+    every transaction which changes the shard, which the live updates of
+    every process poll, see dashboard/live.py
+    """
+    version = models.BigIntegerField(default=0)
     class Meta:
-        db_table = "keyresults"
\ No newline at end of file
+        db_table = "metrics_version"
@@ -0,0 +1,265 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# On-demand profiler for the analytics views
+#
+# A view decorated with `profile_view` runs under cProfile when the request
+# asks for it with the `profile` query parameter or the `X-Dashboard-Profile`
+# header, and the requester is staff or settings.DEBUG is on. Every SQL
+# statement is captured with its timing and EXPLAIN plan. The cache is
+# bypassed so that the computation itself is profiled, and the shards are
+# queried one after the other so that all of their statements are captured.
+#
+# `profile=1` returns a report page instead of the normal response
+# `profile=download` returns the cProfile file(open it with pstats or
+# snakeviz)
+#
+# The profile and the SQL report are saved under settings.DASHBOARD_PROFILE_DIR
+# (default logs/profiles) for later comparison
+#
+# Sample usage
+# http://<IP>/dashboard/departments?on_track_filter=1 years&profile=1
+# curl -H "X-Dashboard-Profile: download" http://<IP>/dashboard/teams?department_name=Product
+import cProfile
+import logging
+import os
+import pstats
+
+from contextlib import ExitStack
+from datetime import datetime
+from functools import wraps
+from io import StringIO
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse
+from django.shortcuts import render
+
+from .cache import bypass_cache
+from .sharding import sequential_scatter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PARAM = "profile"
+PROFILE_HEADER = "HTTP_X_DASHBOARD_PROFILE"
+DOWNLOAD_MODE = "download"
+# Distinct statements explained per profile
+MAX_EXPLAINED_STATEMENTS = 50
+# Lines of the function statistics shown in the report
+MAX_STATS_LINES = 40
+
+
+class _QueryRecorder(object):
+    """
+    Database execute wrapper which records every statement with its timing
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "alias": self.alias,
+                "sql": sql,
+                "params": params,
+                "many": many,
+                "duration_ms": (perf_counter() - started) * 1000,
+            })
+
+
+def profile_view(view):
+    """
+    Decorator which profiles the view when the request asks for it
+    Args:
+        view - view function
+    Returns:
+        wrapped view function
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        mode = _get_profile_mode(request)
+        if mode is None:
+            return view(request, *args, **kwargs)
+        return _profile(view, mode, request, *args, **kwargs)
+    return wrapper
+
+def _get_profile_mode(request):
+    """
+    Function to get the requested profile mode
+    Args:
+        request - HTTP request
+    Returns:
+        "report", "download" or None when the request is not profiled
+    """
+    mode = request.GET.get(PROFILE_PARAM, None) or \
+           request.META.get(PROFILE_HEADER, None)
+    if not mode or mode.lower() in ("0", "false", "off"):
+        return None
+    user = getattr(request, "user", None)
+    if not settings.DEBUG and not (user is not None and user.is_staff):
+        logger.warning("Ignoring profile request from a non staff user")
+        return None
+    return DOWNLOAD_MODE if mode.lower() == DOWNLOAD_MODE else "report"
+
+def _profile(view, mode, request, *args, **kwargs):
+    """
+    Function to run the view under cProfile and capture its SQL statements
+    Args:
+        view - view function
+        mode - "report" or "download"
+        request - HTTP request
+    Returns:
+        HTTP response with the report page or the profile file
+    """
+    recorders = [_QueryRecorder(connection.alias)
+                 for connection in connections.all()]
+    profiler = cProfile.Profile()
+    started = perf_counter()
+    with ExitStack() as stack:
+        for recorder in recorders:
+            stack.enter_context(
+                connections[recorder.alias].execute_wrapper(recorder))
+        stack.enter_context(bypass_cache())
+        # Keep every shard's queries in this thread, where they are recorded
+        stack.enter_context(sequential_scatter())
+        profiler.enable()
+        try:
+            response = view(request, *args, **kwargs)
+            if response.streaming:
+                # A streamed page does its work while it is consumed
+                for _ in response.streaming_content:
+                    pass
+        finally:
+            profiler.disable()
+    elapsed_ms = (perf_counter() - started) * 1000
+    queries = [query for recorder in recorders for query in recorder.queries]
+    _explain_queries(queries)
+
+    profile_path, report_path = _save_profile(view.__name__, request,
+                                              profiler, queries, elapsed_ms)
+    logger.info("Saved profile of %s to %s" % (request.get_full_path(),
+                                               profile_path))
+    if mode == DOWNLOAD_MODE:
+        return FileResponse(open(profile_path, "rb"), as_attachment=True,
+                            filename=os.path.basename(profile_path))
+    context = {
+        "path": request.get_full_path(),
+        "status_code": response.status_code,
+        "elapsed_ms": round(elapsed_ms, 2),
+        "sql_ms": round(sum(query["duration_ms"] for query in queries), 2),
+        "queries": queries,
+        "dashboard_stats": _format_stats(profiler, "dashboard"),
+        "stats": _format_stats(profiler),
+        "profile_path": profile_path,
+        "report_path": report_path,
+    }
+    return render(request, 'profile.html', context)
+
+def _explain_queries(queries):
+    """
+    Function to add the EXPLAIN plan to the captured SELECT statements
+    Args:
+        queries - captured queries, updated in place with a "plan" key
+    """
+    plans = {}
+    for query in queries:
+        query["duration_ms"] = round(query["duration_ms"], 3)
+        query["plan"] = ""
+        sql = query["sql"]
+        if query["many"] or not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        key = (query["alias"], sql, repr(query["params"]))
+        if key not in plans:
+            if len(plans) >= MAX_EXPLAINED_STATEMENTS:
+                continue
+            plans[key] = _explain(query["alias"], sql, query["params"])
+        query["plan"] = plans[key]
+
+def _explain(alias, sql, params):
+    """
+    Function to get the plan of a statement
+    Args:
+        alias - database alias the statement ran on
+        sql - statement
+        params - statement params
+    Returns:
+        plan as text, empty when the backend is not supported
+    """
+    connection = connections[alias]
+    if connection.vendor == "postgresql":
+        prefix = "EXPLAIN "
+    elif connection.vendor == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    elif connection.vendor == "mysql":
+        prefix = "EXPLAIN "
+    else:
+        return ""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return "\n".join(" ".join(str(column) for column in row)
+                             for row in cursor.fetchall())
+    except Exception as err:
+        return "Explain failed: %s" % str(err)
+
+def _format_stats(profiler, restriction=None):
+    """
+    Function to format the function statistics sorted by cumulative time
+    Args:
+        profiler - cProfile.Profile
+        restriction - regex of the functions to show, default all
+    Returns:
+        statistics as text
+    """
+    stream = StringIO()
+    stats = pstats.Stats(profiler, stream=stream).sort_stats("cumulative")
+    if restriction:
+        stats.print_stats(restriction, MAX_STATS_LINES)
+    else:
+        stats.print_stats(MAX_STATS_LINES)
+    return stream.getvalue()
+
+def _save_profile(view_name, request, profiler, queries, elapsed_ms):
+    """
+    Function to save the profile and the SQL report
+    Args:
+        view_name - name of the profiled view
+        request - HTTP request
+        profiler - cProfile.Profile
+        queries - captured queries
+        elapsed_ms - wall clock time of the view
+    Returns:
+        profile_path - path of the cProfile file
+        report_path - path of the text report
+    """
+    profile_dir = getattr(settings, "DASHBOARD_PROFILE_DIR",
+                          os.path.join(settings.BASE_DIR, "logs", "profiles"))
+    os.makedirs(profile_dir, exist_ok=True)
+    name = "%s-%s-%s" % (view_name,
+                         datetime.now().strftime("%Y%m%d-%H%M%S-%f"),
+                         os.getpid())
+    profile_path = os.path.join(profile_dir, name + ".prof")
+    report_path = os.path.join(profile_dir, name + ".txt")
+    profiler.dump_stats(profile_path)
+    with open(report_path, "w") as report:
+        report.write("Request: %s\n" % request.get_full_path())
+        report.write("Elapsed: %.2f ms, queries: %s, SQL time: %.2f ms\n\n"
+                     % (elapsed_ms, len(queries),
+                        sum(query["duration_ms"] for query in queries)))
+        for index, query in enumerate(queries, 1):
+            report.write("#%s [%s] %.3f ms\n%s\nParams: %s\n"
+                         % (index, query["alias"], query["duration_ms"],
+                            query["sql"], query["params"]))
+            if query["plan"]:
+                report.write("Plan:\n%s\n" % query["plan"])
+            report.write("\n")
+        report.write(_format_stats(profiler))
+    return (profile_path, report_path)
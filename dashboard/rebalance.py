@@ -0,0 +1,203 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Placement of the departments on their shards
+#
+# A department belongs on `shard_for_department(department_id)`, the crc32 of
+# its id modulo the no of shards(see dashboard/sharding.py). Changing
+# settings.DASHBOARD_SHARDS therefore changes the shard of most departments,
+# and every new shard is seeded by migration 0001 with all the sample
+# departments. Nothing moves the rows by itself: the `rebalance_shards`
+# command finds the departments stored on a shard they don't belong on and
+# moves each of them with its teams, users, objectives, key results, archived
+# key results and summaries.
+#
+# A move copies the department over whatever the target shard has of it, in
+# one transaction on the target, then deletes it from the source in one
+# transaction on the source. Surrogate keys are assigned anew on the target.
+# A move which stopped in between leaves the department on both shards, and
+# running the command again repeats it. Run it while the dashboard takes no
+# writes, a write routed to the target during a move can be overwritten.
+#
+# Settings(all optional)
+# DASHBOARD_REBALANCE = {
+#     "BATCH_SIZE": 1000, # rows read per query while copying
+# }
+#
+# Sample usage
+# for department_id, source, target in get_misplaced_departments(get_shards()):
+#     move_department(department_id, source, target)
+import logging
+
+from django.conf import settings
+from django.db import models, transaction
+
+from .models import (Department, KeyResults, KeyResultsArchive,
+                     KeyResultsSummary, Objectives, SurrogateKeyModel, Teams,
+                     Users)
+from .sharding import shard_for_department
+from .signals import metrics_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "BATCH_SIZE": 1000,
+}
+
+
+def get_rebalance_settings():
+    """
+    Function to get the rebalance settings merged with the defaults
+    Returns:
+        dict of DEFAULT_SETTINGS keys
+    """
+    rebalance_settings = dict(DEFAULT_SETTINGS)
+    rebalance_settings.update(getattr(settings, "DASHBOARD_REBALANCE", {}))
+    return rebalance_settings
+
+def get_misplaced_departments(aliases):
+    """
+    Function to find the departments stored on a database other than their
+    shard
+    Args:
+        aliases - database aliases to look at, e.g. the shards and a shard
+                  being drained
+    Returns:
+        list of (department_id, source alias, target alias)
+    """
+    misplaced = []
+    for using in aliases:
+        for department_id in Department.objects.using(using).order_by(
+                "pk").values_list("pk", flat=True):
+            target = shard_for_department(department_id)
+            if target != using:
+                misplaced.append((department_id, using, target))
+    return misplaced
+
+def move_department(department_id, source, target, batch_size=None):
+    """
+    Function to move a department with its related rows to another shard
+    Args:
+        department_id - department primary key
+        source - database alias the department is stored on
+        target - database alias the department is moved to
+        batch_size - rows read per query, default from the settings
+    Returns:
+        dict of the no of rows copied per table
+    """
+    batch_size = batch_size or get_rebalance_settings()["BATCH_SIZE"]
+    with transaction.atomic(using=target), metrics_batch(target):
+        # The copy on the target, e.g. a seeded or half moved department,
+        # is replaced by the source's
+        Department.objects.using(target).filter(pk=department_id).delete()
+        copied = _copy_department(department_id, source, target, batch_size)
+    with transaction.atomic(using=source), metrics_batch(source):
+        Department.objects.using(source).filter(pk=department_id).delete()
+    logger.info("Moved department %s from %s to %s: %s"
+                % (department_id, source, target, copied))
+    return copied
+
+def _copy_department(department_id, source, target, batch_size):
+    """
+    Function to copy a department with its related rows to another shard
+    Args:
+        department_id - department primary key
+        source - database alias to copy from
+        target - database alias to copy to
+        batch_size - rows read per query
+    Returns:
+        dict of the no of rows copied per table
+    """
+    copied = {}
+    copied["department"] = _copy_rows(
+        Department.objects.using(source).filter(pk=department_id), target,
+        batch_size)
+    # The team leads are users of the teams, set once the users are copied
+    team_leads = {}
+
+    def without_team_lead(team):
+        team_leads[team.pk] = team.team_lead_id_id
+        team.team_lead_id_id = None
+
+    copied["teams"] = _copy_rows(
+        Teams.objects.using(source).filter(department_id=department_id),
+        target, batch_size, without_team_lead)
+    copied["users"] = _copy_rows(
+        Users.objects.using(source).filter(
+            team_id__department_id=department_id), target, batch_size)
+    copied_users = set(Users.objects.using(target).filter(
+                       team_id__department_id=department_id).values_list(
+                       "pk", flat=True))
+    for team_id, user_id in team_leads.items():
+        if user_id is None:
+            continue
+        if user_id not in copied_users:
+            logger.warning("Team %s of department %s is led by user %s of "
+                           "another department, its team lead is not copied"
+                           % (team_id, department_id, user_id))
+            continue
+        Teams.objects.using(target).filter(pk=team_id).update(
+            team_lead_id=user_id)
+    objectives = Objectives.objects.using(source).filter(
+                 user_id__team_id__department_id=department_id)
+    copied["objectives"] = _copy_rows(objectives, target, batch_size)
+    # The key results reference their objective by its surrogate key, which
+    # differs between the shards
+    target_sids = dict(Objectives.objects.using(target).filter(
+                       user_id__team_id__department_id=department_id
+                       ).values_list("pk", "sid"))
+    source_objectives = dict(objectives.values_list("sid", "pk"))
+
+    def with_target_objective(keyresult):
+        if keyresult.objective_id_id is not None:
+            keyresult.objective_id_id = target_sids[
+                source_objectives[keyresult.objective_id_id]]
+
+    copied["keyresults"] = _copy_rows(
+        KeyResults.objects.using(source).filter(
+            objective_id__user_id__team_id__department_id=department_id),
+        target, batch_size, with_target_objective)
+    copied["keyresults_archive"] = _copy_rows(
+        KeyResultsArchive.objects.using(source).filter(
+            objective_id__user_id__team_id__department_id=department_id),
+        target, batch_size)
+    copied["keyresults_summary"] = _copy_rows(
+        KeyResultsSummary.objects.using(source).filter(
+            objective_id__user_id__team_id__department_id=department_id),
+        target, batch_size)
+    return copied
+
+def _copy_rows(queryset, target, batch_size, prepare=None):
+    """
+    Function to insert the rows of a queryset on another database. The
+    surrogate keys and the auto incremented primary keys are assigned by
+    the target, the other rows are saved raw to keep their values as they
+    are, e.g. the archived date
+    Args:
+        queryset - rows to copy
+        target - database alias to copy to
+        batch_size - rows read per query
+        prepare - function called with every row before it is inserted
+    Returns:
+        no of rows copied
+    """
+    model = queryset.model
+    assigned = {field.attname for field in model._meta.concrete_fields
+                if field.name == "sid" or
+                isinstance(field, (models.AutoField, models.BigAutoField))}
+    count = 0
+    for row in queryset.order_by("pk").iterator(chunk_size=batch_size):
+        for attname in assigned:
+            setattr(row, attname, None)
+        if prepare is not None:
+            prepare(row)
+        row._state.adding = True
+        row._state.db = None
+        if isinstance(row, SurrogateKeyModel):
+            row.save(force_insert=True, using=target)
+        else:
+            row.save_base(raw=True, force_insert=True, using=target)
+        count += 1
+    return count
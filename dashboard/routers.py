@@ -0,0 +1,66 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Database router which places the dashboard models on the shard of their
+# department, see dashboard/sharding.py
+#
+# Objects fetched from a shard, and objects created with a related object
+# fetched from it, stay on that shard. New departments, and new teams of a
+# department id, are placed by the department id. Objects which can't be
+# placed go to the default database.
+#
+# `Model.save()` and `objects.create()`(see models.ShardedQuerySet) route
+# through the new object. `get_or_create()`, `bulk_create()` and every read
+# without an instance use the default database, pass the shard with
+# `.using(shard_for_department(department_id))`.
+#
+# Enable it in settings
+# DATABASE_ROUTERS = ['dashboard.routers.DepartmentShardRouter']
+from .models import Department, Teams
+from .sharding import get_shards, shard_for_department
+
+APP_LABEL = "dashboard"
+
+
+class DepartmentShardRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return self._shard_for_instance(hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return self._shard_for_instance(hints.get("instance"))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if APP_LABEL not in (obj1._meta.app_label, obj2._meta.app_label):
+            return None
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == APP_LABEL:
+            return db in get_shards()
+        return None
+
+    def _shard_for_instance(self, instance):
+        """
+        Function to get the shard of a model instance
+        Args:
+            instance - model instance or None
+        Returns:
+            database alias, None when it can't be decided
+        """
+        if instance is None:
+            return None
+        if instance._state.db is not None:
+            return instance._state.db
+        if isinstance(instance, Department) and instance.pk is not None:
+            return shard_for_department(instance.pk)
+        if isinstance(instance, Teams) and \
+                instance.department_id_id is not None:
+            return shard_for_department(instance.department_id_id)
+        return None
@@ -0,0 +1,129 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Department sharding of the dashboard tables
+#
+# Every department lives on one database alias from settings.DASHBOARD_SHARDS
+# together with its teams, users, objectives and key results. The shard of a
+# department is a stable hash of its `department_id`. Org wide analysis is
+# computed by running the same partial aggregation on every shard in
+# parallel and merging the partial results.
+#
+# The shards are queried from a pool of worker threads which lives as long as
+# the process, so their database connections are reused across requests
+# within CONN_MAX_AGE like the request threads' connections.
+#
+# Settings
+# DASHBOARD_SHARDS = ["default"] # default, a single database
+# DASHBOARD_SHARD_WORKERS = 4 * len(DASHBOARD_SHARDS) # pool size, optional
+#
+# Sample usage
+# shard = shard_for_department("2")
+# Teams.objects.using(shard).filter(department_id="2")
+# counts = scatter(lambda using: Objectives.objects.using(using).count())
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from zlib import crc32
+
+from django.conf import settings
+from django.db import close_old_connections
+
+DEFAULT_SHARDS = ["default"]
+
+_local = threading.local()
+_executor_lock = threading.Lock()
+_executor = None
+
+
+def get_shards():
+    """
+    Function to get the database aliases of the shards
+    Returns:
+        list of database aliases
+    """
+    return list(getattr(settings, "DASHBOARD_SHARDS", DEFAULT_SHARDS))
+
+def shard_for_department(department_id):
+    """
+    Function to get the shard of a department
+    Args:
+        department_id - department primary key
+    Returns:
+        database alias
+    """
+    shards = get_shards()
+    if len(shards) == 1:
+        return shards[0]
+    return shards[crc32(str(department_id).encode("utf-8")) % len(shards)]
+
+@contextmanager
+def sequential_scatter():
+    """
+    Context manager within which `scatter` runs the shards one after the
+    other in the calling thread, e.g. so that a profiler sees every query
+    """
+    previous = getattr(_local, "sequential", False)
+    _local.sequential = True
+    try:
+        yield
+    finally:
+        _local.sequential = previous
+
+def scatter(function, *args):
+    """
+    Function to run a partial aggregation on every shard in parallel
+    Args:
+        function - function called as function(using, *args)
+    Returns:
+        list of the results, in the order of the shards
+    """
+    shards = get_shards()
+    # A scatter from a pool thread runs inline, waiting on the pool from
+    # its own thread could exhaust it
+    if len(shards) == 1 or getattr(_local, "sequential", False) or \
+            getattr(_local, "in_pool", False):
+        return [function(using, *args) for using in shards]
+
+    def run(using):
+        _local.in_pool = True
+        # Drops connections past CONN_MAX_AGE or left unusable, like the
+        # request_started/request_finished signals do for request threads
+        close_old_connections()
+        try:
+            return function(using, *args)
+        finally:
+            close_old_connections()
+
+    return list(_get_executor(len(shards)).map(run, shards))
+
+def _get_executor(shards_count):
+    """
+    Function to get the process wide pool of shard worker threads
+    Args:
+        shards_count - no of shards
+    Returns:
+        ThreadPoolExecutor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "DASHBOARD_SHARD_WORKERS",
+                                    4 * shards_count),
+                thread_name_prefix="dashboard-shard")
+    return _executor
+
+def gather_sum(function, *args):
+    """
+    Function to run a partial aggregation returning a tuple of counts on
+    every shard and add up the counts
+    Args:
+        function - function called as function(using, *args)
+    Returns:
+        tuple of the summed counts
+    """
+    return tuple(map(sum, zip(*scatter(function, *args))))
@@ -0,0 +1,64 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Signal handlers of the dashboard models, connected in DashboardConfig.ready
+#
+# Any change to the models behind the metrics bumps the metrics version of
+# its shard once the transaction is committed, once per transaction, which
+# the live update broadcasters poll(see dashboard/live.py). The handlers are
+# connected to those models only, so the other models keep their fast
+# deletes. Bulk `QuerySet.update()` calls don't send signals, call
+# `bump_metrics_version(using)` after them; wrap batches of saves or deletes
+# outside a transaction in `metrics_batch` to bump the version once.
+#
+# Sample usage
+# with transaction.atomic(using=using), metrics_batch(using):
+#     KeyResults.objects.using(using).filter(pk__in=pks).delete()
+import threading
+
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save
+
+from .live import bump_metrics_version_on_commit
+from .models import Department, KeyResults, Objectives, Teams, Users
+
+METRICS_MODELS = (Department, Teams, Users, Objectives, KeyResults)
+
+_local = threading.local()
+
+
+def metrics_changed(sender, using, **kwargs):
+    if getattr(_local, "in_batch", False):
+        return
+    bump_metrics_version_on_commit(using)
+
+@contextmanager
+def metrics_batch(using):
+    """
+    Context manager which bumps the metrics version once for the changes
+    made inside it, instead of once per object
+    Args:
+        using - database alias the changes are made on
+    """
+    previous = getattr(_local, "in_batch", False)
+    _local.in_batch = True
+    try:
+        yield
+    finally:
+        _local.in_batch = previous
+    bump_metrics_version_on_commit(using)
+
+def connect_signals():
+    """
+    Function to connect the handlers to the models behind the metrics
+    """
+    for model in METRICS_MODELS:
+        post_save.connect(metrics_changed, sender=model,
+                          dispatch_uid="metrics_changed_save_%s"
+                                       % model._meta.model_name)
+        post_delete.connect(metrics_changed, sender=model,
+                            dispatch_uid="metrics_changed_delete_%s"
+                                         % model._meta.model_name)
@@ -0,0 +1,122 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the dashboard admin(see dashboard/admin.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_admin
+from unittest import mock, skipIf
+
+from django.contrib.admin import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import User
+from django.http import QueryDict
+from django.test import TestCase
+
+from dashboard import admin
+from dashboard.models import (COMPLETE_CODE, PENDING_CODE, Department,
+                              KeyResults, Objectives, Teams, Users)
+from dashboard.sharding import get_shards, shard_for_department
+
+KEYRESULTS_URL = "/admin/dashboard/keyresults/"
+
+
+class KeyResultsActionsTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        department = Department.objects.create(department_id="t1",
+                                               name="Admin test")
+        team = Teams.objects.create(team_id="t1", department_id=department)
+        user = Users.objects.create(user_id="t1", team_id=team)
+        objective = Objectives.objects.create(objective_id="t1", user_id=user)
+        self.pks = ["t%s" % keyresult_no for keyresult_no in range(5)]
+        for pk in self.pks:
+            KeyResults.objects.create(keyresult_id=pk, objective_id=objective,
+                                      status="Pending")
+        self.using = shard_for_department("t1")
+        # The shard filter is only there with several shards
+        self.url = KEYRESULTS_URL if len(get_shards()) == 1 else \
+                   "%s?%s=%s" % (KEYRESULTS_URL, admin.SHARD_PARAM, self.using)
+        self.client.force_login(User.objects.create_superuser(
+                                "admin", "admin@example.com", "admin"))
+
+    def _run_action(self, action):
+        with mock.patch.object(admin, "BULK_UPDATE_BATCH_SIZE", 2), \
+                mock.patch.object(admin, "bump_metrics_version") as bump:
+            response = self.client.post(
+                       self.url, {"action": action,
+                                  ACTION_CHECKBOX_NAME: self.pks})
+        self.assertEqual(response.status_code, 302)
+        return bump
+
+    def test_mark_complete_keeps_the_status_code_in_step(self):
+        bump = self._run_action("mark_complete")
+        keyresults = KeyResults.objects.using(self.using).filter(
+                     pk__in=self.pks)
+        self.assertEqual(set(keyresults.values_list("status", "status_code")),
+                         {("Complete", COMPLETE_CODE)})
+        # Three batches, one bump
+        self.assertEqual(bump.call_count, 1)
+
+        bump = self._run_action("mark_pending")
+        self.assertEqual(set(keyresults.values_list("status", "status_code")),
+                         {("Pending", PENDING_CODE)})
+        self.assertEqual(bump.call_count, 1)
+
+
+class ShardFilterTests(TestCase):
+    databases = "__all__"
+
+    def test_unknown_shard_falls_back_to_the_first(self):
+        self.assertEqual(admin.get_admin_shard({}), get_shards()[0])
+        self.assertEqual(admin.get_admin_shard({admin.SHARD_PARAM: "bogus"}),
+                         get_shards()[0])
+
+    def test_change_views_read_the_changelist_filters(self):
+        request = mock.Mock(GET=QueryDict("_changelist_filters=%s%%3Dx"
+                                          % admin.SHARD_PARAM))
+        self.assertEqual(admin._get_shard_params(request)[admin.SHARD_PARAM],
+                         "x")
+
+    @skipIf(len(get_shards()) < 2, "needs at least two shards")
+    def test_changelist_lists_the_selected_shard(self):
+        self.client.force_login(User.objects.create_superuser(
+                                "admin", "admin@example.com", "admin"))
+        for using in get_shards():
+            Department.objects.using(using).create(
+                department_id="a-%s" % using, name="Admin %s" % using)
+        for using in get_shards():
+            response = self.client.get("/admin/dashboard/department/",
+                                       {admin.SHARD_PARAM: using})
+            listed = set(department.pk for department
+                         in response.context["cl"].result_list)
+            self.assertIn("a-%s" % using, listed)
+            self.assertFalse(any(pk.startswith("a-") and pk != "a-%s" % using
+                                 for pk in listed))
+            self.assertContains(response, "By shard")
+
+
+class EstimatedCountPaginatorTests(TestCase):
+
+    def test_large_results_use_the_estimate(self):
+        with mock.patch.object(admin, "_get_estimated_count",
+                               return_value=50000):
+            paginator = admin.EstimatedCountPaginator(
+                        Department.objects.order_by("pk"), 10)
+            self.assertEqual(paginator.count, 50000)
+            self.assertEqual(paginator.num_pages, 5000)
+
+    def test_small_results_are_counted(self):
+        departments = Department.objects.order_by("pk")
+        with mock.patch.object(admin, "_get_estimated_count",
+                               return_value=5):
+            self.assertEqual(admin.EstimatedCountPaginator(
+                             departments, 10).count, departments.count())
+
+    def test_no_estimate_without_postgres(self):
+        if Department.objects.db != "default" or \
+                admin.connections["default"].vendor == "postgresql":
+            self.skipTest("needs a backend without estimates")
+        self.assertIsNone(admin._get_estimated_count(Department.objects.all()))
@@ -0,0 +1,102 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the admission control(see dashboard/admission.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_admission
+import tempfile
+import threading
+
+from time import sleep
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from dashboard import admission, views
+from dashboard.admission import AdmissionRejected, _Limiter
+from dashboard.cache import get_cache_settings, get_or_compute
+
+DEPARTMENTS_URL = "/dashboard/departments"
+
+
+class LimiterTests(SimpleTestCase):
+
+    def test_sheds_when_the_queue_is_full(self):
+        limiter = _Limiter("test", capacity=2, max_queued=0, queue_timeout=1)
+        units = limiter.acquire(2)
+        with self.assertRaises(AdmissionRejected):
+            limiter.acquire(1)
+        limiter.release(units)
+        limiter.release(limiter.acquire(1))
+        stats = limiter.get_stats()
+        self.assertEqual((stats["admitted"], stats["shed"], stats["running"]),
+                         (2, 1, 0))
+
+    def test_sheds_after_the_queue_timeout(self):
+        limiter = _Limiter("test", capacity=1, max_queued=1,
+                           queue_timeout=0.05)
+        limiter.acquire(1)
+        with self.assertRaises(AdmissionRejected):
+            limiter.acquire(1)
+        self.assertEqual(limiter.get_stats()["timed_out"], 1)
+
+    def test_cost_is_capped_at_the_capacity(self):
+        limiter = _Limiter("test", capacity=4, max_queued=0, queue_timeout=1)
+        self.assertEqual(limiter.acquire(100), 4)
+
+    def test_queued_request_is_admitted_on_release(self):
+        limiter = _Limiter("test", capacity=2, max_queued=2, queue_timeout=5)
+        units = limiter.acquire(2)
+        admitted = []
+        waiter = threading.Thread(target=lambda: admitted.append(
+                                  limiter.acquire(1)))
+        waiter.start()
+        sleep(0.05)
+        self.assertEqual(limiter.get_stats()["queued"], 1)
+        limiter.release(units)
+        waiter.join(5)
+        self.assertEqual(admitted, [1])
+
+
+class DepartmentsCostTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        caches[get_cache_settings()["ALIAS"]].clear()
+
+    def test_cached_analysis_costs_one(self):
+        request = RequestFactory().get(DEPARTMENTS_URL,
+                                       {"on_track_filter": "2 years"})
+        self.assertGreater(views._estimate_departments_cost(request), 1)
+        get_or_compute(views._get_departments_cache_key(request),
+                       lambda: {"departments": []})
+        self.assertEqual(views._estimate_departments_cost(request), 1)
+
+    def test_invalid_params_cost_one_without_a_warning(self):
+        for params in ({"fields": "bogus"}, {"on_track_filter": "2weeks"},
+                       {"recently_upd_filter": "two weeks"}):
+            request = RequestFactory().get(DEPARTMENTS_URL, params)
+            with self.assertNoLogs("dashboard", "WARNING"):
+                self.assertEqual(views._estimate_departments_cost(request), 1)
+
+    def test_profiled_request_is_charged_in_full(self):
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        self.client.force_login(User.objects.create_user(
+                                "staff", password="staff", is_staff=True))
+        get_or_compute(views._get_departments_cache_key(
+                       RequestFactory().get(DEPARTMENTS_URL)),
+                       lambda: {"departments": []})
+        with mock.patch.object(admission._Limiter, "acquire", autospec=True,
+                               return_value=1) as acquire, \
+                mock.patch.object(views, "estimate_cost", return_value=7):
+            self.client.get(DEPARTMENTS_URL)
+            self.assertEqual(acquire.call_args[0][1], 1)
+            with self.settings(DASHBOARD_PROFILE_DIR=profile_dir.name):
+                self.client.get(DEPARTMENTS_URL, {"profile": "1"})
+            self.assertEqual(acquire.call_args[0][1], 7)
@@ -0,0 +1,87 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the key results archival(see dashboard/archive.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_archive
+from datetime import date, timedelta
+
+from django.test import TestCase
+
+from dashboard import views
+from dashboard.archive import archive_keyresults_batch
+from dashboard.models import (Department, KeyResults, KeyResultsSummary,
+                              Objectives, Teams, Users)
+from dashboard.sharding import (get_shards, sequential_scatter,
+                                shard_for_department)
+
+
+class ArchiveTests(TestCase):
+    """
+    The aggregations return the same answers before and after archival
+    """
+    databases = "__all__"
+
+    def setUp(self):
+        today = date.today()
+        department = Department.objects.create(department_id="t1",
+                                               name="Archive test")
+        team = Teams.objects.create(team_id="t1", department_id=department)
+        user = Users.objects.create(user_id="t1", first_name="Test",
+                                    last_name="User", team_id=team)
+        for objective_no in range(6):
+            objective = Objectives.objects.create(
+                        objective_id="t%s" % objective_no, user_id=user)
+            for keyresult_no in range(5):
+                days_ago = (objective_no * 17 + keyresult_no * 11) % 120
+                status = "Pending" if (objective_no + keyresult_no) % 3 \
+                         else "Complete"
+                KeyResults.objects.create(
+                    keyresult_id="t%s-%s" % (objective_no, keyresult_no),
+                    objective_id=objective, status=status,
+                    updated_date=today - timedelta(days=days_ago))
+
+    def _get_analysis(self):
+        # The shards are queried in the test's thread, which sees the test
+        # data before it is committed
+        with sequential_scatter():
+            return self._get_shards_analysis()
+
+    def _get_shards_analysis(self):
+        today = date.today()
+        analysis = {}
+        for days in (0, 7, 20, 45, 60, 90, 200):
+            filter_date = today - timedelta(days=days)
+            analysis["on_track_%s" % days] = views._get_on_track_objectives(
+                                             filter_date)
+            analysis["updated_%s" % days] = views._get_updated_objectives(
+                                            filter_date)
+        for start, end in ((60, 30), (45, 20), (100, 0), (200, 90)):
+            analysis["between_%s_%s" % (start, end)] = \
+                views._get_updated_objectives_bw_dates(
+                    today - timedelta(days=start), today - timedelta(days=end))
+        return analysis
+
+    def test_archival_keeps_the_analysis(self):
+        before = self._get_analysis()
+        cutoff = date.today() - timedelta(days=30)
+        for using in get_shards():
+            while archive_keyresults_batch(cutoff, 7, using):
+                pass
+            self.assertFalse(KeyResults.objects.using(using).filter(
+                             updated_date__lt=cutoff).exists())
+        self.assertTrue(any(KeyResultsSummary.objects.using(using).exists()
+                            for using in get_shards()))
+        self.assertEqual(before, self._get_analysis())
+
+    def test_archival_is_resumable(self):
+        cutoff = date.today() - timedelta(days=30)
+        archive_keyresults_batch(cutoff, 3, shard_for_department("t1"))
+        before = self._get_analysis()
+        for using in get_shards():
+            while archive_keyresults_batch(cutoff, 3, using):
+                pass
+        self.assertEqual(before, self._get_analysis())
@@ -0,0 +1,42 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the stale-while-revalidate cache(see dashboard/cache.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_cache
+import threading
+
+from time import sleep
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from dashboard.cache import get_cache_settings, get_or_compute
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        caches[get_cache_settings()["ALIAS"]].clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            sleep(0.1)
+            return {"value": 1}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+                   get_or_compute("tests:single_flight", compute)[0]))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"value": 1}] * 5)
@@ -0,0 +1,143 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the compact schema migration(see dashboard/compact.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_compact
+from importlib import import_module
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+
+from dashboard.compact import resync_status_codes_batch
+from dashboard.models import (COMPLETE_CODE, PENDING_CODE, Department,
+                              KeyResults, Objectives, Teams, Users)
+from dashboard.sharding import get_shards, shard_for_department
+
+BEFORE_BACKFILL = ("dashboard", "0005_metrics_version")
+
+
+class CompactSchemaTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        department = Department.objects.create(department_id="t1",
+                                               name="Compact test")
+        team = Teams.objects.create(team_id="t1", department_id=department)
+        user = Users.objects.create(user_id="t1", team_id=team)
+        self.objective = Objectives.objects.create(objective_id="t1",
+                                                   user_id=user)
+        for keyresult_no in range(5):
+            KeyResults.objects.create(keyresult_id="t%s" % keyresult_no,
+                                      objective_id=self.objective,
+                                      status="Pending")
+        self.using = shard_for_department("t1")
+
+    def test_new_rows_get_surrogate_keys(self):
+        keyresults = KeyResults.objects.using(self.using).filter(
+                     objective_id=self.objective)
+        self.assertIsNotNone(self.objective.sid)
+        self.assertEqual(len(set(keyresults.values_list("sid", flat=True))),
+                         5)
+        self.assertEqual(keyresults.filter(
+                         objective_id__objective_id="t1").count(), 5)
+
+    def test_status_change_with_update_fields_updates_the_code(self):
+        keyresult = KeyResults.objects.using(self.using).get(pk="t0")
+        keyresult.status = "Complete"
+        keyresult.save(update_fields=["status"])
+        keyresult.refresh_from_db()
+        self.assertEqual(keyresult.status_code, COMPLETE_CODE)
+
+    def test_resync_corrects_mismatched_codes(self):
+        # The seed data has no status codes
+        self._resync()
+        keyresults = KeyResults.objects.using(self.using).filter(
+                     objective_id=self.objective)
+        keyresults.filter(pk__in=["t1", "t3"]).update(status="Complete")
+        self.assertEqual(self._resync(), 2)
+        self.assertEqual(self._resync(), 0)
+        self.assertEqual(dict(keyresults.values_list("pk", "status_code")),
+                         {"t0": PENDING_CODE, "t1": COMPLETE_CODE,
+                          "t2": PENDING_CODE, "t3": COMPLETE_CODE,
+                          "t4": PENDING_CODE})
+
+    def _resync(self):
+        total = 0
+        after_pk = None
+        while True:
+            corrected, after_pk = resync_status_codes_batch(2, after_pk,
+                                                            self.using)
+            total += corrected
+            if after_pk is None:
+                return total
+
+
+class CompactSchemaMigrationTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.using = get_shards()[0]
+        self.executor = MigrationExecutor(connections[self.using])
+        self.latest = self.executor.loader.graph.leaf_nodes("dashboard")
+        self.executor.migrate([BEFORE_BACKFILL])
+        # Rows written by the code of migration 0005, without surrogate keys
+        apps = self.executor.loader.project_state(BEFORE_BACKFILL).apps
+        department = apps.get_model("dashboard", "Department").objects.using(
+                     self.using).create(department_id="m1")
+        team = apps.get_model("dashboard", "Teams").objects.using(
+               self.using).create(team_id="m1", department_id=department)
+        user = apps.get_model("dashboard", "Users").objects.using(
+               self.using).create(user_id="m1", team_id=team)
+        objective = apps.get_model("dashboard", "Objectives").objects.using(
+                    self.using).create(objective_id="m1", user_id=user)
+        for keyresult_no in range(2):
+            apps.get_model("dashboard", "KeyResults").objects.using(
+                self.using).create(keyresult_id="m%s" % keyresult_no,
+                                   objective_id=objective,
+                                   status="Complete")
+
+    def tearDown(self):
+        self._migrate_to_latest()
+
+    def test_backfill_then_migrate(self):
+        call_command("compact_schema", "--batch-size", "1", stdout=mock.Mock())
+        # Filled by the command, migration 0006 finds nothing left
+        sid = Objectives.objects.using(self.using).filter(
+              pk="m1").values_list("sid", flat=True).get()
+        self.assertIsNotNone(sid)
+        self.assertEqual(list(KeyResults.objects.using(self.using).filter(
+                         pk__in=["m0", "m1"]).values_list("objective_id",
+                                                          flat=True)),
+                         [sid, sid])
+        self._migrate_to_latest()
+        objective = Objectives.objects.using(self.using).get(pk="m1")
+        keyresults = KeyResults.objects.using(self.using).filter(
+                     objective_id=objective)
+        self.assertIsNotNone(objective.sid)
+        self.assertEqual(set(keyresults.values_list("pk", "status_code")),
+                         {("m0", COMPLETE_CODE), ("m1", COMPLETE_CODE)})
+        self.assertEqual(KeyResults.objects.using(self.using).filter(
+                         objective_id__objective_id="m1").count(), 2)
+
+    def test_migration_fills_a_few_rows_left(self):
+        self._migrate_to_latest()
+        self.assertEqual(KeyResults.objects.using(self.using).filter(
+                         objective_id__objective_id="m1").count(), 2)
+
+    def test_migration_stops_with_too_many_rows_left(self):
+        migration = import_module(
+                    "dashboard.migrations.0006_surrogate_keys_not_null")
+        with mock.patch.object(migration, "BATCH_SIZE", 0):
+            with self.assertRaises(migration.BackfillIncomplete):
+                self._migrate_to_latest()
+
+    def _migrate_to_latest(self):
+        executor = MigrationExecutor(connections[self.using])
+        executor.migrate(self.latest)
@@ -0,0 +1,53 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the departments endpoint
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_departments
+from django.core.cache import caches
+from django.test import TestCase
+
+from dashboard import views
+from dashboard.cache import get_cache_settings
+from dashboard.sharding import sequential_scatter
+
+
+class DepartmentFieldsTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        caches[get_cache_settings()["ALIAS"]].clear()
+
+    def test_only_the_requested_metrics_are_computed(self):
+        fields = views._get_department_fields("users_count, teams_count")
+        self.assertEqual(fields, ("name", "teams_count", "users_count"))
+        with sequential_scatter():
+            subset = views._get_all_departments(fields)
+            full = views._get_all_departments()
+        self.assertTrue(subset)
+        for department in subset:
+            self.assertEqual(set(department), {"department_id", "name",
+                                               "teams_count", "users_count"})
+        self.assertEqual(
+            sorted(subset, key=lambda dept: dept["department_id"]),
+            sorted(({key: dept[key] for key in ("department_id", "name",
+                                                 "teams_count", "users_count")}
+                    for dept in full), key=lambda dept: dept["department_id"]))
+
+    def test_all_metrics_by_default(self):
+        self.assertEqual(views._get_department_fields(None),
+                         views.DEPARTMENT_FIELDS)
+
+    def test_unknown_field_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, "bogus"):
+            views._get_department_fields("teams_count,bogus")
+
+    def test_departments_page_with_fields(self):
+        with sequential_scatter():
+            response = self.client.get("/dashboard/departments",
+                                       {"fields": "teams_count"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "departments.html")
@@ -0,0 +1,98 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the live metric updates(see dashboard/live.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_live
+from datetime import date
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from dashboard import live, signals
+from dashboard.archive import archive_keyresults_batch
+from dashboard.models import (Department, KeyResults, MetricsVersion,
+                              Objectives, Teams, Users)
+from dashboard.sharding import get_shards, shard_for_department
+
+
+class LiveTests(TransactionTestCase):
+    databases = "__all__"
+
+    def test_commit_bumps_the_metrics_version(self):
+        version = live.get_metrics_version() or 0
+        Department.objects.create(department_id="t1", name="Live test")
+        self.assertEqual(live.get_metrics_version(), version + 1)
+
+    def test_commit_bumps_the_version_of_its_shard(self):
+        using = shard_for_department("t1")
+        versions = self._get_shard_versions()
+        Department.objects.create(department_id="t1", name="Live test")
+        expected = dict(versions)
+        expected[using] += 1
+        self.assertEqual(self._get_shard_versions(), expected)
+
+    def test_transaction_bumps_the_metrics_version_once(self):
+        using = shard_for_department("t1")
+        version = live.get_metrics_version() or 0
+        with transaction.atomic(using=using):
+            department = Department.objects.create(department_id="t1",
+                                                   name="Live test")
+            Teams.objects.create(team_id="t1", department_id=department)
+            Teams.objects.create(team_id="t2", department_id=department)
+        self.assertEqual(live.get_metrics_version(), version + 1)
+
+    def test_rolled_back_savepoint_keeps_the_bump_of_the_transaction(self):
+        using = shard_for_department("t1")
+        version = live.get_metrics_version() or 0
+        with transaction.atomic(using=using):
+            try:
+                with transaction.atomic(using=using):
+                    Department.objects.create(department_id="t1",
+                                              name="Live test")
+                    raise RuntimeError("rolled back")
+            except RuntimeError:
+                pass
+            Department.objects.create(department_id="t2", name="Live test 2")
+        self.assertEqual(live.get_metrics_version(), version + 1)
+
+    def test_nested_metrics_batch_restores_the_outer_batch(self):
+        using = shard_for_department("t1")
+        with signals.metrics_batch(using):
+            with signals.metrics_batch(using):
+                pass
+            self.assertTrue(signals._local.in_batch)
+        self.assertFalse(signals._local.in_batch)
+
+    def test_archive_batch_bumps_the_metrics_version_once(self):
+        department = Department.objects.create(department_id="t1",
+                                               name="Live test")
+        team = Teams.objects.create(team_id="t1", department_id=department)
+        user = Users.objects.create(user_id="t1", team_id=team)
+        objective = Objectives.objects.create(objective_id="t1", user_id=user)
+        for keyresult_no in range(5):
+            KeyResults.objects.create(
+                keyresult_id="t%s" % keyresult_no, objective_id=objective,
+                status="Pending", updated_date=date(2000, 1, 1))
+        version = live.get_metrics_version() or 0
+        self.assertEqual(archive_keyresults_batch(
+                         date(2001, 1, 1), 10, shard_for_department("t1")), 5)
+        self.assertEqual(live.get_metrics_version(), version + 1)
+
+    def test_stream_closed_before_the_first_event_unsubscribes(self):
+        events = live.stream("tests:live", lambda: {"departments": []})
+        self.assertEqual(live._subscriber_count, 1)
+        events.close()
+        events.close()
+        self.assertEqual(live._subscriber_count, 0)
+        self.assertNotIn("tests:live", live._broadcasters)
+
+    def _get_shard_versions(self):
+        # The rows are flushed between the tests and recreated on a bump
+        return {using: MetricsVersion.objects.using(using).filter(
+                       pk=live.VERSION_ID).values_list(
+                       "version", flat=True).first() or 0
+                for using in get_shards()}
@@ -0,0 +1,56 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the loadtest management command
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_loadtest
+from io import StringIO
+from json import loads
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase
+
+from dashboard import views
+from dashboard.cache import get_cache_settings
+
+
+class LoadTestCommandTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        caches[get_cache_settings()["ALIAS"]].clear()
+
+    def _run(self, *args):
+        stdout = StringIO()
+        call_command("loadtest", "--requests", "5", "--concurrency", "1",
+                     "--seed", "1", "--json", *args, stdout=stdout)
+        return loads(stdout.getvalue())
+
+    def test_json_report(self):
+        report = self._run()
+        self.assertEqual(set(report), {"concurrency", "elapsed", "requests",
+                                       "throughput", "endpoints"})
+        self.assertEqual(report["requests"], 5)
+        self.assertEqual(sum(stats["requests"] for stats
+                             in report["endpoints"].values()), 5)
+        for stats in report["endpoints"].values():
+            self.assertEqual(set(stats), {"requests", "throughput", "mean_ms",
+                                          "p50_ms", "p95_ms", "p99_ms",
+                                          "error_rate"})
+            self.assertEqual(stats["error_rate"], 0)
+
+    def test_error_page_counts_as_an_error(self):
+        # The view renders error.html with a 200 status. The filters are
+        # not cached by anything else
+        with mock.patch.object(views, "_get_departments_analysis",
+                               side_effect=RuntimeError("down")):
+            report = self._run("--teams-ratio", "0",
+                               "--on-track-filters", "5 weeks",
+                               "--recently-upd-filters", "7 weeks")
+        self.assertEqual(list(report["endpoints"]), ["departments"])
+        self.assertEqual(report["endpoints"]["departments"]["error_rate"], 100)
@@ -0,0 +1,91 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the dashboard middlewares
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_middleware
+import gzip
+import zlib
+
+from unittest import skipIf
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from dashboard import middleware
+from dashboard.middleware import CompressionMiddleware
+
+CONTENT = b"Objectives on track " * 50
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    def _get_response(self, response, accept_encoding):
+        request = RequestFactory().get(
+                  "/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    @skipIf(middleware.brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        response = self._get_response(HttpResponse(CONTENT), "gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(middleware.brotli.decompress(response.content),
+                         CONTENT)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+    def test_gzip_when_brotli_is_refused(self):
+        response = self._get_response(HttpResponse(CONTENT),
+                                      "br;q=0, gzip;q=0.5")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), CONTENT)
+        self.assertEqual(response["Content-Length"],
+                         str(len(response.content)))
+
+    def test_no_accepted_encoding(self):
+        response = self._get_response(HttpResponse(CONTENT), "identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, CONTENT)
+
+    def test_short_response_is_not_compressed(self):
+        response = self._get_response(HttpResponse(b"ok"), "gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_strong_etag_is_weakened(self):
+        response = HttpResponse(CONTENT)
+        response["ETag"] = '"abc"'
+        response = self._get_response(response, "gzip")
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    def test_event_stream_is_not_compressed(self):
+        response = StreamingHttpResponse(iter([CONTENT]),
+                                         content_type="text/event-stream")
+        response = self._get_response(response, "gzip, br")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(response.streaming_content), CONTENT)
+
+    def test_streamed_chunks_are_flushed(self):
+        chunks = [b"first chunk " * 20, b"second chunk " * 20]
+        response = self._get_response(StreamingHttpResponse(iter(chunks)),
+                                      "gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertFalse(response.has_header("Content-Length"))
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        streamed = iter(response.streaming_content)
+        # Each chunk decompresses in full before the next one is produced
+        for chunk in chunks:
+            self.assertEqual(decompressor.decompress(next(streamed)), chunk)
+        decompressor.decompress(b"".join(streamed))
+        self.assertTrue(decompressor.eof)
+
+    @skipIf(middleware.brotli is None, "brotli is not installed")
+    def test_streamed_brotli_chunks_are_flushed(self):
+        chunks = [b"first chunk " * 20, b"second chunk " * 20]
+        response = self._get_response(StreamingHttpResponse(iter(chunks)),
+                                      "br")
+        decompressor = middleware.brotli.Decompressor()
+        streamed = iter(response.streaming_content)
+        for chunk in chunks:
+            self.assertEqual(decompressor.process(next(streamed)), chunk)
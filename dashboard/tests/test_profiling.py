@@ -0,0 +1,77 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the on-demand profiler(see dashboard/profiling.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_profiling
+import pstats
+import tempfile
+
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory, TestCase, override_settings
+
+from dashboard import views
+from dashboard.cache import get_cache_settings, get_or_compute
+
+DEPARTMENTS_URL = "/dashboard/departments"
+
+
+class ProfileViewTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        caches[get_cache_settings()["ALIAS"]].clear()
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        settings_override = override_settings(
+                            DEBUG=False, DASHBOARD_PROFILE_DIR=profile_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = User.objects.create_user("staff", password="staff",
+                                              is_staff=True)
+
+    def test_non_staff_is_not_profiled(self):
+        with self.assertLogs("dashboard.profiling", "WARNING"):
+            response = self.client.get(DEPARTMENTS_URL, {"profile": "1"})
+        self.assertTemplateUsed(response, "departments.html")
+        self.assertTemplateNotUsed(response, "profile.html")
+
+    def test_report_has_the_sql_and_plans(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(DEPARTMENTS_URL, {"profile": "1"})
+        self.assertTemplateUsed(response, "profile.html")
+        queries = response.context["queries"]
+        self.assertTrue(queries)
+        self.assertTrue(any(query["plan"] for query in queries))
+        self.assertContains(response, "SQL statements")
+
+    def test_download_returns_the_profile_file(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(DEPARTMENTS_URL,
+                                   HTTP_X_DASHBOARD_PROFILE="download")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment", response["Content-Disposition"])
+        self.assertIn(".prof", response["Content-Disposition"])
+        with tempfile.NamedTemporaryFile(suffix=".prof") as profile:
+            profile.write(b"".join(response.streaming_content))
+            profile.flush()
+            self.assertTrue(pstats.Stats(profile.name).total_calls)
+
+    def test_profiled_request_bypasses_the_cache(self):
+        self.client.force_login(self.staff)
+        get_or_compute(views._get_departments_cache_key(
+                       RequestFactory().get(DEPARTMENTS_URL)),
+                       lambda: {"departments": []})
+        with mock.patch.object(views, "_get_departments_analysis",
+                               wraps=views._get_departments_analysis) \
+                as analysis:
+            self.client.get(DEPARTMENTS_URL)
+            self.assertFalse(analysis.called)
+            self.client.get(DEPARTMENTS_URL, {"profile": "1"})
+            self.assertEqual(analysis.call_count, 1)
@@ -0,0 +1,77 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the department moves between shards(see dashboard/rebalance.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_rebalance
+from datetime import date
+from io import StringIO
+from unittest import skipIf
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from dashboard.models import (Department, KeyResults, KeyResultsArchive,
+                              KeyResultsSummary, Objectives, Teams, Users)
+from dashboard.rebalance import get_misplaced_departments, move_department
+from dashboard.sharding import get_shards, shard_for_department
+
+
+@skipIf(len(get_shards()) < 2, "needs at least two shards")
+class RebalanceTests(TestCase):
+    databases = "__all__"
+
+    def test_seeded_departments_are_pruned(self):
+        # Migration 0001 seeds every shard with all the sample departments
+        self.assertTrue(get_misplaced_departments(get_shards()))
+        department_ids = set(Department.objects.values_list("pk", flat=True))
+        call_command("rebalance_shards", stdout=StringIO())
+        self.assertEqual(get_misplaced_departments(get_shards()), [])
+        stored = [pk for using in get_shards() for pk
+                  in Department.objects.using(using).values_list("pk",
+                                                                 flat=True)]
+        self.assertEqual(sorted(stored), sorted(department_ids))
+
+    def test_department_is_moved_with_its_rows(self):
+        source, target = get_shards()[:2]
+        department_id = next("m%s" % number for number in range(100)
+                             if shard_for_department("m%s" % number) == target)
+        department = Department.objects.using(source).create(
+                     department_id=department_id, name="Rebalance test")
+        team = Teams.objects.create(team_id="m1", department_id=department)
+        user = Users.objects.create(user_id="m1", team_id=team)
+        team.team_lead_id = user
+        team.save()
+        objective = Objectives.objects.create(objective_id="m1", user_id=user)
+        for keyresult_no in range(3):
+            KeyResults.objects.create(keyresult_id="m%s" % keyresult_no,
+                                      objective_id=objective,
+                                      status="Complete")
+        KeyResultsArchive.objects.using(source).create(
+            keyresult_id="m9", objective_id=objective,
+            updated_date=date(2000, 1, 1))
+        KeyResultsArchive.objects.using(source).filter(pk="m9").update(
+            archived_date=date(2001, 1, 1))
+        KeyResultsSummary.objects.using(source).create(
+            objective_id=objective, updated_date=date(2000, 1, 1),
+            keyresults_count=1)
+
+        copied = move_department(department_id, source, target, batch_size=2)
+
+        self.assertEqual(copied["keyresults"], 3)
+        self.assertFalse(Department.objects.using(source).filter(
+                         pk=department_id).exists())
+        self.assertFalse(Objectives.objects.using(source).filter(
+                         pk="m1").exists())
+        self.assertEqual(Teams.objects.using(target).get(
+                         pk="m1").team_lead_id_id, "m1")
+        self.assertEqual(KeyResults.objects.using(target).filter(
+                         objective_id__objective_id="m1",
+                         status_code__isnull=False).count(), 3)
+        self.assertEqual(KeyResultsArchive.objects.using(target).get(
+                         pk="m9").archived_date, date(2001, 1, 1))
+        self.assertTrue(KeyResultsSummary.objects.using(target).filter(
+                        objective_id="m1").exists())
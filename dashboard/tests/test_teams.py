@@ -0,0 +1,113 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the teams endpoint and its streamed responses
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_teams
+from json import loads
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from dashboard import views
+from dashboard.admission import _Limiter, _ReleasingIterator
+from dashboard.models import Department, Teams, Users
+
+TEAMS_URL = "/dashboard/teams"
+
+
+class StreamTeamsTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.department = Department.objects.create(department_id="t1",
+                                                    name="Stream test")
+        # Teams of 0 to 3 members besides their leader
+        self.expected = {}
+        for team_no in range(5):
+            team = Teams.objects.create(team_id="t%s" % team_no,
+                                        department_id=self.department)
+            leader = Users.objects.create(user_id="t%s-lead" % team_no,
+                                          first_name="Lead%s" % team_no,
+                                          last_name="L", team_id=team)
+            team.team_lead_id = leader
+            team.save()
+            members = []
+            for member_no in range(team_no % 4):
+                Users.objects.create(user_id="t%s-%s" % (team_no, member_no),
+                                     first_name="Member%s" % member_no,
+                                     last_name="T%s" % team_no, team_id=team)
+                members.append("Member%s T%s" % (member_no, team_no))
+            self.expected["Lead%s" % team_no] = members
+        self.params = {"department_name": "Stream test",
+                       "department_id": "t1"}
+
+    def test_members_across_chunk_boundaries(self):
+        with mock.patch.object(views, "STREAM_CHUNK_SIZE", 2):
+            teams = list(views._iter_teams_for_dept(self.department))
+        self.assertEqual({team["team_leader"]: team["members"]
+                          for team in teams}, self.expected)
+
+    def test_ndjson_stream(self):
+        with mock.patch.object(views, "STREAM_TEAMS_PER_CHUNK", 2):
+            response = self.client.get(TEAMS_URL, dict(self.params,
+                                                       format="ndjson"))
+            chunks = list(response.streaming_content)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        # The department line, then chunks of two teams
+        self.assertEqual(len(chunks), 4)
+        lines = [loads(line) for line in b"".join(chunks).splitlines()]
+        self.assertEqual(lines[0], {"department": "Stream test"})
+        self.assertEqual({team["team_leader"]: team["members"]
+                          for team in lines[1:]}, self.expected)
+        self.assertEqual(sorted(lines[1:], key=str),
+                         sorted(views._get_teams_for_dept("Stream test", "t1"),
+                                key=str))
+
+    def test_html_stream(self):
+        response = self.client.get(TEAMS_URL, dict(self.params, stream="1"))
+        self.assertTrue(response.streaming)
+        page = b"".join(response.streaming_content).decode("utf-8")
+        for leader in self.expected:
+            self.assertIn("%s's team" % leader, page)
+        self.assertTrue(page.rstrip().endswith("</html>"))
+
+    def test_unknown_department_streams_an_empty_page(self):
+        response = self.client.get(TEAMS_URL, {"department_name": "Missing",
+                                               "department_id": "missing",
+                                               "format": "ndjson"})
+        self.assertEqual(b"".join(response.streaming_content),
+                         b'{"department": "Missing"}\n')
+
+
+class ReleasingIteratorTests(SimpleTestCase):
+
+    def test_closed_stream_releases_its_units(self):
+        limiter = _Limiter("test", capacity=4, max_queued=0, queue_timeout=1)
+        units = limiter.acquire(3)
+        closed = []
+
+        def content():
+            try:
+                yield "a"
+                yield "b"
+            finally:
+                closed.append(True)
+
+        stream = _ReleasingIterator(content(), limiter, units)
+        self.assertEqual(next(stream), "a")
+        self.assertEqual(limiter.get_stats()["units_in_use"], 3)
+        stream.close()
+        stream.close()
+        self.assertEqual(closed, [True])
+        stats = limiter.get_stats()
+        self.assertEqual((stats["units_in_use"], stats["running"]), (0, 0))
+
+    def test_exhausted_stream_releases_its_units(self):
+        limiter = _Limiter("test", capacity=4, max_queued=0, queue_timeout=1)
+        stream = _ReleasingIterator(iter(["a"]), limiter, limiter.acquire(2))
+        self.assertEqual(list(stream), ["a"])
+        self.assertEqual(limiter.get_stats()["units_in_use"], 0)
@@ -0,0 +1,89 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Tests of the cache warm-up(see dashboard/warmup.py)
+#
+# Sample usage
+# python manage.py test dashboard.tests.test_warmup
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+
+from dashboard import views, warmup
+from dashboard.cache import get_cache_settings
+from dashboard.middleware import WarmUpMiddleware
+from dashboard.sharding import sequential_scatter
+
+FILTERS = {"on_track_filter": "3 weeks", "recently_upd_filter": "5 weeks"}
+
+
+class WarmUpTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        caches[get_cache_settings()["ALIAS"]].clear()
+        warmup._warm.clear()
+
+    def test_failed_department_lookup_still_warms_up(self):
+        with mock.patch.object(warmup, "_get_busiest_departments",
+                               side_effect=DatabaseError("down")), \
+                sequential_scatter(), \
+                self.assertLogs("dashboard.warmup", "ERROR"):
+            report = warmup.warm_up()
+        self.assertEqual(report["errors"], 1)
+        self.assertTrue(warmup.is_warm())
+        self.assertEqual(self.client.get("/dashboard/ready").status_code, 200)
+
+    @override_settings(DASHBOARD_WARMUP={"TEAMS_DEPARTMENTS": 0})
+    def test_error_page_counts_as_error(self):
+        with mock.patch.object(views, "_get_departments_analysis",
+                               side_effect=DatabaseError("down")), \
+                sequential_scatter(), \
+                self.assertLogs("dashboard.warmup", "ERROR"):
+            report = warmup.warm_up()
+        self.assertEqual((report["requests"], report["errors"]), (1, 1))
+
+    @override_settings(DASHBOARD_WARMUP={"FILTERS": [FILTERS],
+                                         "TEAMS_DEPARTMENTS": 0})
+    def test_pages_claimed_by_another_process_are_skipped(self):
+        self.assertTrue(warmup._claim_page(warmup.DEPARTMENTS_URL, FILTERS,
+                                           300))
+        with sequential_scatter():
+            report = warmup.warm_up()
+        # The first page warms the process itself
+        self.assertEqual((report["requests"], report["skipped"],
+                          report["errors"]), (1, 1, 0))
+
+    @override_settings(DASHBOARD_WARMUP={"FILTERS": [FILTERS],
+                                         "TEAMS_DEPARTMENTS": 0,
+                                         "CLAIM_SECONDS": 0})
+    def test_every_page_is_warmed_without_claims(self):
+        warmup._claim_page(warmup.DEPARTMENTS_URL, FILTERS, 300)
+        with sequential_scatter():
+            report = warmup.warm_up()
+        self.assertEqual((report["requests"], report["skipped"]), (2, 0))
+
+
+class WarmUpMiddlewareTests(TestCase):
+
+    def test_not_used_by_default(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            WarmUpMiddleware()
+
+    @override_settings(DASHBOARD_WARMUP={"ON_FIRST_REQUEST": True})
+    def test_starts_the_warm_up(self):
+        middleware = WarmUpMiddleware()
+        with mock.patch("dashboard.middleware.start_warm_up") as start:
+            middleware.process_request(None)
+        start.assert_called_once_with()
+
+    def test_ready_without_a_warm_up(self):
+        with mock.patch.object(warmup, "_started", False):
+            warmup._warm.clear()
+            self.assertEqual(self.client.get("/dashboard/ready").status_code,
+                             200)
@@ -20,4 +20,7 @@ from . import views
 urlpatterns = [
     path('departments', views.get_departments, name="departments"),
     path('teams', views.get_teams, name="teams"),
+    path('live', views.get_live_updates, name="live"),
+    path('admission', views.get_admission_stats_view, name="admission"),
+    path('ready', views.get_readiness, name="ready"),
 ]
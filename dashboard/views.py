@@ -14,6 +14,10 @@
 # If no params are given default 
 # `on_track_filter`= 1 weeks
 # `recently_upd_filter`= 2 weeks
+# `fields`= comma separated department metrics to compute, default all of
+# teams_count,users_count,objectives_count,objectives_on_track_ratio
+# e.g. fields=objectives_on_track_ratio returns only the department id, the
+# name and the ratio
 #
 # Response(success):
 # {"status": "OK", "data": {"objectives_on_track": {"date_since": "Friday 07/31", "on_track": 1, "total": 3,
@@ -32,27 +36,116 @@
 #
 # Second endpoint
 # Method: GET
-# URL: http://<IP>/dashboard/teams?department_name=Product
+# URL: http://<IP>/dashboard/teams?department_name=Product&department_id=1
 # Description: Rest endpont to get info about all the teams of a department
+# `department_id` is optional, it routes the request straight to the
+# department's shard
+# `stream=1` streams the page a chunk of teams at a time and `format=ndjson`
+# streams one json line per team, for departments too large to render at once
 #
 # Response(success):
 # {"status": "OK", "data": {"teams": [{"team_leader": "Kailash", "members": []}]}}
 # Response(error):
 # {"status": "ERROR", "data": <error message>}
+#
+# Third endpoint
+# Method: GET
+# URL: http://<IP>/dashboard/live?on_track_filter=2 weeks
+# Description: Server-sent events stream of the changes of the departments
+# analysis, takes the same params as the first endpoint
+#
+# Fourth endpoint
+# Method: GET
+# URL: http://<IP>/dashboard/admission
+# Description: Admission control counters of the worker process. The
+# departments and teams endpoints each have a limiter, expensive departments
+# requests are queued and shed with 503 and `Retry-After` under load, see
+# dashboard/admission.py
+#
+# Fifth endpoint
+# Method: GET
+# URL: http://<IP>/dashboard/ready
+# Description: Readiness of the worker process, 503 until its warm-up is done
+#
+# Both endpoints can be profiled by staff users(or anyone when DEBUG is on)
+# with `profile=1`(report page) or `profile=download`(cProfile file), see
+# dashboard/profiling.py
 import logging 
 
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from json import dumps
+from time import time
 from traceback import format_exc
 
-from django.db.models import Q
+from django.core.cache import caches
+from django.db.models import Count
+from django.http import StreamingHttpResponse
 from django.shortcuts import HttpResponse, render
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+from django.utils.timezone import utc
 
-from .models import Department, Teams, Objectives
+from . import live, warmup
+from .admission import admission_control, estimate_cost, get_admission_stats
+from .archive import objectives_with_keyresults_q
+from .cache import get_cache_settings, get_or_compute, is_cached
+from .models import Department, Objectives, Teams, Users
+from .profiling import profile_view
+from .sharding import gather_sum, scatter, shard_for_department
 
 # Create your views here.
 logger = logging.getLogger(__name__)
 
+# Department metrics which can be requested with the `fields` param
+DEPARTMENT_FIELDS = ("name", "teams_count", "users_count", "objectives_count",
+                     "objectives_on_track_ratio")
+# Rows fetched per round trip when the teams page is streamed
+STREAM_CHUNK_SIZE = 1000
+# Teams sent per chunk of the streamed response
+STREAM_TEAMS_PER_CHUNK = 100
+# The pages render `error.html` with a 200 status on failure, which is
+# recognised by its title
+ERROR_PAGE_MARKER = b"500 Server error"
+TEAM_TILE_COLORS = ("#889296", "#d88f8f", "#5795b3")
+TEAM_TILE_HTML = ('<div style="background-color:{}" data-role="tile" '
+                  'data-size="wide"><img class="icon border border-radius-half" '
+                  'data-email="a@b.com" data-role="gravatar" data-size="40" '
+                  'data-default="identicon"><span class="branding-bar '
+                  'text-center">{}\'s team</span></div>')
+# No of objectives of the organisation, refreshed every ORG_SIZE_SECONDS
+ORG_SIZE_KEY = "dashboard:org_size"
+ORG_SIZE_SECONDS = 600
+
+def _estimate_departments_cost(request):
+    """
+    Function to estimate the cost of a departments analysis request from the
+    date span of its filters and the size of the organisation. A request
+    served from the cache, or with invalid params, costs 1. A profiled
+    request bypasses the cache and is charged in full(see profile_view)
+    Args:
+        request - HTTP request
+    Returns:
+        cost in admission capacity units
+    """
+    try:
+        cache_key = _get_departments_cache_key(request)
+        span_days = max(
+            _get_filter_span_days(request.GET.get("on_track_filter", None), 1),
+            _get_filter_span_days(request.GET.get("recently_upd_filter", None),
+                                  2))
+    except ValueError as err:
+        # The view renders the error page without computing anything
+        logger.debug("Invalid departments request params %s, Error: %s"
+                     % (request.GET.urlencode(), str(err)))
+        return 1
+    if is_cached(cache_key):
+        return 1
+    return estimate_cost(span_days, _get_org_size())
+
+# The profiler bypasses the cache, so it wraps the admission control which
+# then charges the full cost of the computation
+@profile_view
+@admission_control("departments", cost=_estimate_departments_cost)
 def get_departments(request):
     """
     Rest endpoint to get departments and analytics on recently updated objectives
@@ -79,52 +172,178 @@ def get_departments(request):
             "direction": "up"
         }, 
         "departments": [
-            {"name": "Product", "teams_count": 2, "users_count": 2,
-                "objectives_count": 1, "objectives_on_track_ratio": 0}, 
-            {"name": "Engineering", "teams_count": 1, "users_count": 1,
-                "objectives_count": 2, "objectives_on_track_ratio": 50}, 
-            {"name": "Marketing", "teams_count": 0, "users_count": 0,
-                "objectives_count": 0, "objectives_on_track_ratio": "--"}
-        ]
+            {"department_id": "1", "name": "Product", "teams_count": 2,
+                "users_count": 2, "objectives_count": 1,
+                "objectives_on_track_ratio": 0}, 
+            {"department_id": "2", "name": "Engineering", "teams_count": 1,
+                "users_count": 1, "objectives_count": 2,
+                "objectives_on_track_ratio": 50}, 
+            {"department_id": "3", "name": "Marketing", "teams_count": 0,
+                "users_count": 0, "objectives_count": 0,
+                "objectives_on_track_ratio": "--"}
+        ],
+        # Time at which the analysis was computed, it may be served stale
+        "data_computed_at": datetime(2020, 8, 7, 10, 0, tzinfo=utc)
 
     }
     """
     if request.method == "GET":
-        resp = {}
         try:
             logger.info("Recieved a request get all the departments and "
                         "analysis on objectives.")
+            # Get the department metrics to compute if provided
+            fields = _get_department_fields(request.GET.get("fields", None))
             # Get the on track date filter if provided
             objective_on_track_filter = request.GET.get(
                                       "on_track_filter", None)
-            # Get on track objectives json
-            on_track_objective_json = _get_objectives_on_tack_analysis(
-                                    objective_on_track_filter)
-            logger.debug("On track objectives analytical data: %s" 
-                         % str(on_track_objective_json))
-            resp["objectives_on_track"] = on_track_objective_json
             # Get recently updated date filter if provided
             objective_recently_upd_filter = request.GET.get(
                                         "recently_upd_filter", None)
-            # Get recently updated objectives json
-            updated_objective_json = _get_objectives_recently_updated_analysis(
-                                objective_recently_upd_filter)
-            logger.debug("Objectives updated recently analytical data: %s" 
-                         % str(updated_objective_json))
-            resp["objectives_updated_recently"] = updated_objective_json
-            # Get all the departments and its info
-            depts = _get_all_departments()
-            logger.debug("All departments json: %s" % str(depts))
-            resp["departments"] = depts
+            # Serve the last computed analysis while it is within the
+            # staleness bounds, it is recomputed in the background
+            resp, computed_at = get_or_compute(
+                              _get_departments_cache_key(request),
+                              lambda: _get_departments_analysis(
+                                  objective_on_track_filter,
+                                  objective_recently_upd_filter, fields))
             logger.info("Departments and objectives analytical output "
                         "response: %s" % str(resp))
-            return render(request, 'departments.html', resp)
+            resp = dict(resp)
+            resp["data_computed_at"] = datetime.fromtimestamp(computed_at,
+                                                              tz=utc)
+            response = render(request, 'departments.html', resp)
+            response["Age"] = str(max(int(time() - computed_at), 0))
+            return response
         except Exception as err:
             logger.error("Error while getting departments and objectives "
                          "analyticl data, Error: %s, Stack: %s" 
                          % (str(err), format_exc()))
     return render(request, 'error.html')
 
+def get_live_updates(request):
+    """
+    Server-sent events endpoint which pushes the changes of the departments
+    analysis, see dashboard/live.py. Takes the same params as get_departments
+    Returns(HTTP response):
+    text/event-stream
+    event: snapshot
+    data: {"objectives_on_track": {...}, "objectives_updated_recently": {...},
+           "departments": {"1": {"department_id": "1", "name": "Product", ...}}}
+
+    event: delta
+    data: {"objectives_on_track": {"on_track": 2, "on_track_ratio": 67}}
+    """
+    if request.method == "GET":
+        try:
+            fields = _get_department_fields(request.GET.get("fields", None))
+            objective_on_track_filter = request.GET.get(
+                                      "on_track_filter", None)
+            objective_recently_upd_filter = request.GET.get(
+                                        "recently_upd_filter", None)
+            logger.info("Recieved a request for live updates of the "
+                        "departments analysis, filters: %s, %s"
+                        % (objective_on_track_filter,
+                           objective_recently_upd_filter))
+            key = "%s:%s:%s" % (objective_on_track_filter,
+                                objective_recently_upd_filter, ",".join(fields))
+            events = live.stream(key, lambda: _get_departments_analysis(
+                                              objective_on_track_filter,
+                                              objective_recently_upd_filter,
+                                              fields))
+            response = StreamingHttpResponse(events,
+                                             content_type="text/event-stream")
+            response["Cache-Control"] = "no-cache"
+            # Ask proxies like nginx not to buffer the stream
+            response["X-Accel-Buffering"] = "no"
+            return response
+        except live.SubscriberLimitReached:
+            logger.warning("Live updates subscriber limit reached")
+            response = HttpResponse("Too many live clients", status=503)
+            response["Retry-After"] = str(
+                live.get_live_settings()["HEARTBEAT_SECONDS"])
+            return response
+        except Exception as err:
+            logger.error("Error while starting live updates, Error: %s, "
+                         "Stack: %s" % (str(err), format_exc()))
+    return render(request, 'error.html')
+
+def get_admission_stats_view(request):
+    """
+    Rest endpoint to get the admission control counters of this process,
+    see dashboard/admission.py
+    Returns(HTTP response):
+    {
+        "departments": {"capacity": 8, "units_in_use": 6, "running": 2,
+                        "queued": 1, "admitted": 120, "queued_total": 14,
+                        "shed": 3, "timed_out": 1},
+        "teams": {...}
+    }
+    """
+    return HttpResponse(dumps(get_admission_stats()),
+                        content_type="application/json")
+
+def get_readiness(request):
+    """
+    Rest endpoint for health checks, the process is ready once its warm-up
+    is done, see dashboard/warmup.py
+    Returns(HTTP response):
+    200 "ready", 503 "warming up"
+    """
+    if warmup.is_warm():
+        return HttpResponse("ready", content_type="text/plain")
+    return HttpResponse("warming up", content_type="text/plain", status=503)
+
+def _get_departments_cache_key(request):
+    """
+    Function to get the analysis cache key of a departments request
+    Args:
+        request - HTTP request
+    Returns:
+        cache key string
+    Raises:
+        ValueError if an unknown metric is requested
+    """
+    fields = _get_department_fields(request.GET.get("fields", None))
+    return "departments:%s:%s:%s" % (request.GET.get("on_track_filter", None),
+                                     request.GET.get("recently_upd_filter",
+                                                     None),
+                                     ",".join(fields))
+
+def _get_departments_analysis(objective_on_track_filter,
+                              objective_recently_upd_filter, fields):
+    """
+    Function to compute the departments and objectives analysis
+    Args:
+        objective_on_track_filter - date since the on track analysis to be done
+        objective_recently_upd_filter - date since the updated objectives
+                                        analysis to be done
+        fields - department metrics to compute
+    Returns:
+        {
+            "objectives_on_track": {...},
+            "objectives_updated_recently": {...},
+            "departments": [...]
+        }
+    """
+    resp = {}
+    # Get on track objectives json
+    on_track_objective_json = _get_objectives_on_tack_analysis(
+                            objective_on_track_filter)
+    logger.debug("On track objectives analytical data: %s" 
+                 % str(on_track_objective_json))
+    resp["objectives_on_track"] = on_track_objective_json
+    # Get recently updated objectives json
+    updated_objective_json = _get_objectives_recently_updated_analysis(
+                           objective_recently_upd_filter)
+    logger.debug("Objectives updated recently analytical data: %s" 
+                 % str(updated_objective_json))
+    resp["objectives_updated_recently"] = updated_objective_json
+    # Get all the departments and the requested metrics
+    depts = _get_all_departments(fields)
+    logger.debug("All departments json: %s" % str(depts))
+    resp["departments"] = depts
+    return resp
+
 def _get_objectives_on_tack_analysis(objective_on_track_filter):
     """
     Function to get objectives on track analysis
@@ -271,11 +490,67 @@ def _get_filter_date(number, unit="weeks"):
         interval = number * 365
     return (date.today() - timedelta(days=interval))
 
-def _get_all_departments():
+def _get_filter_span_days(date_filter, default_weeks):
+    """
+    Function to get the no of days covered by a date filter
+    Args:
+        date_filter - filter like "2 weeks", None for the default
+        default_weeks - weeks covered when the filter is None
+    Returns:
+        no of days
+    Raises:
+        ValueError if the filter is not a number and a unit
+    """
+    if date_filter is None:
+        return default_weeks * 7
+    num, unit = date_filter.split(" ")
+    return (date.today() - _get_filter_date(int(num), unit)).days
+
+def _get_org_size():
     """
-    Function to get all the departments info
+    Function to get the no of objectives of the organisation, cached for
+    ORG_SIZE_SECONDS
+    Returns:
+        no of objectives
+    """
+    cache = caches[get_cache_settings()["ALIAS"]]
+    org_size = cache.get(ORG_SIZE_KEY)
+    if org_size is None:
+        org_size = sum(scatter(
+                   lambda using: Objectives.objects.using(using).count()))
+        cache.set(ORG_SIZE_KEY, org_size, ORG_SIZE_SECONDS)
+    return org_size
+
+def _get_department_fields(fields):
+    """
+    Function to get the department metrics requested with the `fields` param
+    Args:
+        fields - comma separated metric names, None for all the metrics
+    Returns:
+        tuple of metric names, `name` is always included
+    Raises:
+        ValueError if an unknown metric is requested
+    """
+    if fields is None:
+        return DEPARTMENT_FIELDS
+    requested = set(field.strip() for field in fields.split(",")
+                    if field.strip())
+    unknown = requested - set(DEPARTMENT_FIELDS)
+    if unknown:
+        raise ValueError("Unknown department fields: %s"
+                         % ", ".join(sorted(unknown)))
+    requested.add("name")
+    return tuple(field for field in DEPARTMENT_FIELDS if field in requested)
+
+def _get_all_departments(fields=DEPARTMENT_FIELDS):
+    """
+    Function to get all the departments info. The departments of every
+    shard are gathered in parallel
+    Args:
+        fields - department metrics to compute, default all
     Returns:
         {
+            "department_id": "1", # Dept id
             "name": "Product", # Dept name
             "teams_count": 2, # total no of teams in the dept
             "users_count": 2, # Total no of employees in the dept
@@ -284,91 +559,89 @@ def _get_all_departments():
         }
     """
     res = []
-    departments = Department.objects.all()
-    for dept in departments:
-        # Get the team count, user count objectives count and on track ratio
-        teams_count, users_count, \
-        objectives_count, on_track_objectives = _get_dept_teams(dept)
-        dept_details = {
-            "name": dept.name,
-            "teams_count": teams_count,
-            "users_count": users_count,
-            "objectives_count": objectives_count,
-            "objectives_on_track_ratio": round(
-                on_track_objectives /
-                objectives_count * 100) if objectives_count else "--"
-        }
-        res.append(dept_details)
+    for shard_departments in scatter(_get_shard_departments, fields):
+        res.extend(shard_departments)
     return res
 
-def _get_dept_teams(dept):
+def _get_shard_departments(using, fields):
     """
-    Get teams count, users count, objectives count, on_track_objectives for a dept
+    Function to get the departments info of a shard. Only the requested
+    metrics are computed, each metric is a single grouped query over all the
+    departments of the shard
     Args:
-        dept - department object
+        using - database alias of the shard
+        fields - department metrics to compute
     Returns:
-        teams_count - total no of teams
-        users_count - total no of users
-        objectives_count - total no of objectives 
-        on_track_objectives - total no of on track objectives
+        {
+            "department_id": "1", # Dept id
+            "name": "Product", # Dept name
+            "teams_count": 2, # total no of teams in the dept
+            "users_count": 2, # Total no of employees in the dept
+            "objectives_count": 1, # tot no of objectives
+            "objectives_on_track_ratio": 0 # Objective on track ratio
+        }
     """
-    teams_count = users_count = objectives_count = on_track_objectives = 0
-    for team in  dept.teams_set.all():
-        teams_count += 1
-        users_count, objectives_count, \
-        on_track_objectives = _get_team_users(team, users_count,
-                                             objectives_count, on_track_objectives)
-    return (teams_count, users_count, objectives_count, on_track_objectives)
-
+    teams_count = users_count = objectives_count = on_track_objectives = {}
+    if "teams_count" in fields:
+        teams_count = _count_by_department(Teams.objects.using(using),
+                                           "department_id")
+    if "users_count" in fields:
+        users_count = _count_by_department(Users.objects.using(using),
+                                           "team_id__department_id")
+    if "objectives_count" in fields or \
+            "objectives_on_track_ratio" in fields:
+        objectives_count = _count_by_department(
+                         Objectives.objects.using(using),
+                         "user_id__team_id__department_id")
+    if "objectives_on_track_ratio" in fields:
+        on_track_objectives = _count_by_department(
+                            Objectives.objects.using(using).filter(
+                                _get_on_track_objectives_q()),
+                            "user_id__team_id__department_id")
+    res = []
+    departments = Department.objects.using(using).values_list(
+                  "department_id", "name")
+    for dept_id, dept_name in departments:
+        dept_details = {"department_id": dept_id, "name": dept_name}
+        if "teams_count" in fields:
+            dept_details["teams_count"] = teams_count.get(dept_id, 0)
+        if "users_count" in fields:
+            dept_details["users_count"] = users_count.get(dept_id, 0)
+        if "objectives_count" in fields:
+            dept_details["objectives_count"] = objectives_count.get(dept_id, 0)
+        if "objectives_on_track_ratio" in fields:
+            dept_objectives = objectives_count.get(dept_id, 0)
+            dept_details["objectives_on_track_ratio"] = round(
+                on_track_objectives.get(dept_id, 0) /
+                dept_objectives * 100) if dept_objectives else "--"
+        res.append(dept_details)
+    return res
 
-def _get_team_users(team, users_count, objectives_count, on_track_objectives):
+def _count_by_department(queryset, dept_lookup):
     """
-    Function to get the no of users, objectives and on track objectives for a team
+    Function to count the rows of a queryset per department
     Args:
-        team - team object
-        users_count - cumulative users count
-        objectives_count - cumulative objectives count
-        on_track_objectives - cumulative on track objectives count
+        queryset - queryset to count
+        dept_lookup - lookup from the queryset model to the department id
     Returns:
-        users_count - total no of users in a team
-        objectives_count - total no of objectives for the team
-        on_track_objectives - total no of on track objectives for the team
-    """
-    for user in team.users_set.all():
-        users_count += 1
-        objectives_count, on_track_objectives =  _get_user_objectives(
-                                              user, 
-                                              objectives_count, 
-                                              on_track_objectives)
-    return (users_count, objectives_count, on_track_objectives)
-
-def _get_user_objectives(
-        user, objectives_count=0, 
-        on_track_objectives=0):
-    """
-    Function to get the total objectives and on track objectives for a user
-    Args:
-        user - user object
-        objectives_count - cumulative objectives count
-        on_track_objectives - cumulative on track objectives count
+        {<department_id>: count}
+    """
+    counts = queryset.order_by().values(dept_lookup).annotate(
+             count=Count("pk")).values_list(dept_lookup, "count")
+    return dict(counts)
+
+def _get_on_track_objectives_q():
+    """
+    Function to get the condition for an objective to be on track, i.e it has
+    key results and none of them are pending. Archived key results are
+    included through their summaries
     Returns:
-        objectives_count - total no of objectives for an user
-        on_track_objectives - total no of on track objectives for an user
-    """
-    for objective in user.objectives_set.all():
-        objectives_count += 1
-        completed_keyresults_set = objective.keyresults_set
-        if completed_keyresults_set.count():
-            completed_keyresults = completed_keyresults_set.filter(
-                                 ~Q(status="Complete"))
-            if not completed_keyresults:
-                # If none of the key results are pending
-                on_track_objectives += 1
-    return (objectives_count, on_track_objectives)
-
-def _get_on_track_objectives(
-        filter_date, objectives_count=0, 
-        on_track_objectives=0):
+        Q object on Objectives
+    """
+    return objectives_with_keyresults_q() & \
+           ~objectives_with_keyresults_q(pending=True)
+
+def _get_on_track_objectives(filter_date):
     """
     Function to get the objectives count and on track objectives after filter_date
     Args:
@@ -378,20 +651,26 @@ def _get_on_track_objectives(
         objectives_count - total objectives count
         on_track_objectives - on track objectives count after filter_date
     """
-    for objective in Objectives.objects.all():
-        objectives_count += 1
-        on_track_keyresults_set = objective.keyresults_set
-        if on_track_keyresults_set.count():
-            on_track_keyresults = on_track_keyresults_set.filter(
-                                Q(updated_date__gte=filter_date) &
-                                ~Q(status="Complete"))
-            if not on_track_keyresults:
-                on_track_objectives += 1
+    return gather_sum(_get_shard_on_track_objectives, filter_date)
+
+def _get_shard_on_track_objectives(using, filter_date):
+    """
+    Function to get the objectives count and on track objectives of a shard
+    Args:
+        using - database alias of the shard
+        filter_date - date after which the on track objectives are counted
+    Returns:
+        on_track_objectives - on track objectives count after filter_date
+        objectives_count - total objectives count
+    """
+    objectives_count = Objectives.objects.using(using).count()
+    on_track_objectives = Objectives.objects.using(using).filter(
+                        objectives_with_keyresults_q() &
+                        ~objectives_with_keyresults_q(since=filter_date,
+                                                      pending=True)).count()
     return (on_track_objectives, objectives_count)
 
-def _get_updated_objectives(
-        updated_date, objectives_count=0, 
-        updated_objectives=0):
+def _get_updated_objectives(updated_date):
     """
     Function to get the objectives count and on updated objectives after updated_date
     Args:
@@ -401,19 +680,24 @@ def _get_updated_objectives(
         objectives_count - total objectives count
         on_track_objectives - updated  objectives count after updated_date
     """
-    for objective in Objectives.objects.all():
-        objectives_count += 1
-        updated_keyresults_set = objective.keyresults_set
-        if updated_keyresults_set.count():
-            updated_keyresults = updated_keyresults_set.filter(
-                               updated_date__gte=updated_date)
-            if updated_keyresults:
-                updated_objectives += 1
+    return gather_sum(_get_shard_updated_objectives, updated_date)
+
+def _get_shard_updated_objectives(using, updated_date):
+    """
+    Function to get the objectives count and updated objectives of a shard
+    Args:
+        using - database alias of the shard
+        updated_date - date after which the updated objectives are counted
+    Returns:
+        updated_objectives - updated objectives count after updated_date
+        objectives_count - total objectives count
+    """
+    objectives_count = Objectives.objects.using(using).count()
+    updated_objectives = Objectives.objects.using(using).filter(
+                       objectives_with_keyresults_q(since=updated_date)).count()
     return (updated_objectives, objectives_count)
 
-def _get_updated_objectives_bw_dates(
-        start_date, end_date, objectives_count=0, 
-        updated_objectives=0):
+def _get_updated_objectives_bw_dates(start_date, end_date):
     """
     Function to get the objectives count and on updated objectives between the dates
     Args:
@@ -423,17 +707,29 @@ def _get_updated_objectives_bw_dates(
         objectives_count - total objectives count
         on_track_objectives - updated  objectives count between the dates.
     """
-    for objective in Objectives.objects.all():
-        objectives_count += 1
-        updated_keyresults_set = objective.keyresults_set
-        if updated_keyresults_set.count():
-            updated_keyresults = updated_keyresults_set.filter(
-                               Q(updated_date__gte=start_date) &
-                               Q(updated_date__lte=end_date))
-            if updated_keyresults:
-                updated_objectives += 1
+    return gather_sum(_get_shard_updated_objectives_bw_dates, start_date,
+                      end_date)
+
+def _get_shard_updated_objectives_bw_dates(using, start_date, end_date):
+    """
+    Function to get the objectives count and updated objectives of a shard
+    between the dates
+    Args:
+        using - database alias of the shard
+        start_date - date from which the updated objectives are counted
+        end_date - date to which the updated objectives are counted
+    Returns:
+        updated_objectives - updated objectives count between the dates
+        objectives_count - total objectives count
+    """
+    objectives_count = Objectives.objects.using(using).count()
+    updated_objectives = Objectives.objects.using(using).filter(
+                       objectives_with_keyresults_q(since=start_date,
+                                                    until=end_date)).count()
     return (updated_objectives, objectives_count)
 
+@profile_view
+@admission_control("teams")
 def get_teams(request):
     """
     Rest endpoint to get teams and info for a department
@@ -453,13 +749,21 @@ def get_teams(request):
         ],
         "department": "Product"
     }
+    With `stream=1` the page is streamed a chunk of teams at a time, with
+    `format=ndjson` one json line per team is streamed instead
     """
     if request.method == "GET":
         try:
             department_name = request.GET.get("department_name", None)
+            # The department id, when given, locates the department's shard
+            department_id = request.GET.get("department_id", None)
             logger.info("Recieved request to fetch all the teams for the "
                         "department: %s" % department_name)
-            teams = _get_teams_for_dept(department_name)
+            stream_format = _get_stream_format(request)
+            if stream_format is not None:
+                return _stream_teams(request, department_name, department_id,
+                                     stream_format)
+            teams = _get_teams_for_dept(department_name, department_id)
             resp = {
                 "department": department_name,
                 "teams": teams
@@ -472,11 +776,125 @@ def get_teams(request):
                          " Stack: %s" % (department_name, str(err), format_exc()))
     return render(request, 'error.html')
 
-def _get_teams_for_dept(dept_name):
+def _get_stream_format(request):
+    """
+    Function to get the streaming format requested for the teams page
+    Args:
+        request - HTTP request
+    Returns:
+        "ndjson", "html" or None when the page isn't streamed
+    """
+    if request.GET.get("format", "").lower() == "ndjson":
+        return "ndjson"
+    if request.GET.get("stream", "").lower() in ("1", "true", "on"):
+        return "html"
+    return None
+
+def _stream_teams(request, dept_name, dept_id, stream_format):
+    """
+    Function to stream the teams of a department. Teams and members are read
+    in chunks with `.iterator()`, so the memory used stays the same whatever
+    the size of the department
+    Args:
+        request - HTTP request
+        dept_name - department name
+        dept_id - department id, optional
+        stream_format - "html" or "ndjson"
+    Returns:
+        StreamingHttpResponse
+    """
+    dept = _find_department(dept_name, dept_id)
+    if stream_format == "ndjson":
+        return StreamingHttpResponse(_stream_teams_ndjson(dept, dept_name),
+                                     content_type="application/x-ndjson")
+    context = {"department": dept_name}
+    header = render_to_string("teams_stream_header.html", context, request)
+    footer = render_to_string("teams_stream_footer.html", context, request)
+    return StreamingHttpResponse(_stream_teams_html(dept, dept_name, header,
+                                                    footer),
+                                 content_type="text/html; charset=utf-8")
+
+def _stream_teams_ndjson(dept, dept_name):
+    """
+    Generator of the ndjson lines of the teams of a department, the first
+    line names the department
+    Args:
+        dept - Department object, None if it doesn't exist
+        dept_name - department name
+    """
+    yield dumps({"department": dept_name}) + "\n"
+    lines = []
+    try:
+        if dept is not None:
+            for team in _iter_teams_for_dept(dept):
+                lines.append(dumps(team) + "\n")
+                if len(lines) >= STREAM_TEAMS_PER_CHUNK:
+                    yield "".join(lines)
+                    lines = []
+    except Exception as err:
+        # The response has started, the stream can only be cut short
+        logger.error("Error streaming teams for department: %s, Error: %s,"
+                     " Stack: %s" % (dept_name, str(err), format_exc()))
+    if lines:
+        yield "".join(lines)
+
+def _stream_teams_html(dept, dept_name, header, footer):
+    """
+    Generator of the teams page of a department, a chunk of team tiles at
+    a time
+    Args:
+        dept - Department object, None if it doesn't exist
+        dept_name - department name
+        header - rendered page up to the teams container
+        footer - rendered rest of the page
+    """
+    yield header
+    tiles = []
+    try:
+        if dept is not None:
+            # The tiles only show the team leader
+            teams = _iter_teams_for_dept(dept, with_members=False)
+            for index, team in enumerate(teams):
+                tiles.append(format_html(
+                    TEAM_TILE_HTML,
+                    TEAM_TILE_COLORS[index % len(TEAM_TILE_COLORS)],
+                    team["team_leader"]))
+                if len(tiles) >= STREAM_TEAMS_PER_CHUNK:
+                    yield "".join(tiles)
+                    tiles = []
+    except Exception as err:
+        logger.error("Error streaming teams for department: %s, Error: %s,"
+                     " Stack: %s" % (dept_name, str(err), format_exc()))
+    if tiles:
+        yield "".join(tiles)
+    yield footer
+
+def _find_department(dept_name, dept_id=None):
+    """
+    Function to find a department on its shard
+    Args:
+        dept_name = department name
+        dept_id = department id, optional. The department is looked up on
+                  its shard directly when given, else on every shard
+    Returns:
+        Department object, None if it doesn't exist
+    """
+    if dept_id is not None:
+        return Department.objects.using(shard_for_department(dept_id)).filter(
+               pk=dept_id).first()
+    found = [dept for shard_depts in scatter(
+                 lambda using: list(Department.objects.using(using).filter(
+                                    name__iexact=dept_name)[:1]))
+             for dept in shard_depts]
+    return found[0] if found else None
+
+def _get_teams_for_dept(dept_name, dept_id=None):
     """
     Function to return the team details for a department
     Args:
         dept_name = department name
+        dept_id = department id, optional. The department is looked up on
+                  its shard directly when given, else on every shard
     Returns:
         [
             {
@@ -489,10 +907,9 @@ def _get_teams_for_dept(dept_name):
             }
         ]
     """
-    dept = Department.objects.filter(name__iexact=dept_name)
+    dept = _find_department(dept_name, dept_id)
     all_teams = []
-    if dept:
-        dept = dept[0]
+    if dept is not None:
         teams = dept.teams_set.all()
         for team in teams:
             team_details = {}
@@ -500,11 +917,54 @@ def _get_teams_for_dept(dept_name):
             team_members = list(map(lambda x: "%s %s" 
                                               % (x.first_name, x.last_name), 
                                               team.users_set.all()))
-            team_lead_full_name = "%s %s" % (team.team_lead_id.first_name, 
-                                             team.team_lead_id.last_name)
-            if team_lead_full_name in team_members:
-                # Remove the team leader from the team members group
-                team_members.remove(team_lead_full_name)
-            team_details["members"] = team_members
+            team_details["members"] = _remove_team_leader(team, team_members)
             all_teams.append(team_details)
-    return all_teams
\ No newline at end of file
+    return all_teams
+
+def _iter_teams_for_dept(dept, with_members=True):
+    """
+    Generator of the team details of a department. Teams and members are
+    both read in team order with `.iterator()`, the members of a team are
+    the next consecutive rows of the members cursor
+    Args:
+        dept - Department object
+        with_members - False to skip reading the members
+    Yields:
+        {"team_leader": "Kailash", "members": ["Preetam", "Rekha"]}
+    """
+    using = dept._state.db
+    teams = Teams.objects.using(using).filter(department_id=dept).select_related(
+            "team_lead_id").order_by("pk").iterator(
+            chunk_size=STREAM_CHUNK_SIZE)
+    members = iter(())
+    if with_members:
+        members = Users.objects.using(using).filter(
+                  team_id__department_id=dept).order_by(
+                  "team_id", "pk").values_list(
+                  "team_id", "first_name", "last_name").iterator(
+                  chunk_size=STREAM_CHUNK_SIZE)
+    member = next(members, None)
+    for team in teams:
+        team_members = []
+        while member is not None and member[0] == team.pk:
+            team_members.append("%s %s" % (member[1], member[2]))
+            member = next(members, None)
+        yield {
+            "team_leader": team.team_lead_id.first_name,
+            "members": _remove_team_leader(team, team_members)
+        }
+
+def _remove_team_leader(team, team_members):
+    """
+    Function to remove the team leader from the team members group
+    Args:
+        team - Teams object
+        team_members - list of member full names
+    Returns:
+        team_members without the team leader
+    """
+    team_lead_full_name = "%s %s" % (team.team_lead_id.first_name, 
+                                     team.team_lead_id.last_name)
+    if team_lead_full_name in team_members:
+        team_members.remove(team_lead_full_name)
+    return team_members
\ No newline at end of file
@@ -0,0 +1,266 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Warm-up of a worker process before it serves traffic
+#
+# The departments page is requested once for the default filters and for
+# every configured filter combination, which fills the analysis cache, and
+# the teams page for the busiest departments(most users). The requests go
+# through the views, so the templates, the database connections and the
+# database's own caches are warm as well. A page served with the error page
+# counts as an error. The production server runs it from gunicorn's
+# `post_worker_init` hook(see gunicorn.conf.py), before the worker accepts
+# connections. Other servers, e.g. runserver, run it in a background thread
+# started by the first request when `ON_FIRST_REQUEST` is set(see
+# WarmUpMiddleware in dashboard/middleware.py); the readiness endpoint
+# reports 503 until it is done.
+#
+# The workers which start together share the work: a process claims each
+# page in the analysis cache before requesting it, and skips the pages
+# another process claimed within `CLAIM_SECONDS`, whose results are already
+# in the shared cache. The first page is always requested, it warms the
+# process itself. With a per process cache backend nothing is skipped.
+#
+# Settings(all optional)
+# DASHBOARD_WARMUP = {
+#     "ENABLED": True,
+#     "ON_FIRST_REQUEST": False, # warm up from WarmUpMiddleware
+#     # query params of the departments page besides the defaults
+#     "FILTERS": [{"on_track_filter": "2 weeks", "recently_upd_filter": "4 weeks"}],
+#     "TEAMS_DEPARTMENTS": 5, # no of busiest departments
+#     "CLAIM_SECONDS": 300, # 0 to request every page in every process
+# }
+#
+# Sample usage
+# report = warm_up()
+# start_warm_up() # in the background, once per process
+import logging
+import os
+import threading
+
+from hashlib import md5
+from time import perf_counter
+from traceback import format_exc
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Count
+from django.test import RequestFactory
+
+from .cache import get_cache_settings
+from .models import Users
+from .sharding import scatter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "ENABLED": True,
+    "ON_FIRST_REQUEST": False,
+    "FILTERS": [],
+    "TEAMS_DEPARTMENTS": 5,
+    "CLAIM_SECONDS": 300,
+}
+DEPARTMENTS_URL = "/dashboard/departments"
+TEAMS_URL = "/dashboard/teams"
+CLAIM_KEY_PREFIX = "dashboard:warmup:"
+
+_warm = threading.Event()
+_started_lock = threading.Lock()
+_started = False
+
+
+def get_warmup_settings():
+    """
+    Function to get the warm-up settings merged with the defaults
+    Returns:
+        dict of DEFAULT_SETTINGS keys
+    """
+    warmup_settings = dict(DEFAULT_SETTINGS)
+    warmup_settings.update(getattr(settings, "DASHBOARD_WARMUP", {}))
+    return warmup_settings
+
+def is_warm():
+    """
+    Function to check if the process is ready to serve traffic
+    Returns:
+        True once the warm-up is done, or when the process doesn't warm up
+    """
+    return _warm.is_set() or not _started
+
+def start_warm_up():
+    """
+    Function to warm the process up in a background thread, the first call
+    of the process starts it and the later calls do nothing
+    Returns:
+        True if this call started the warm-up
+    """
+    global _started
+    if _started:
+        return False
+    with _started_lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=_warm_up_in_background, daemon=True,
+                     name="dashboard-warmup").start()
+    return True
+
+def warm_up(on_step=None):
+    """
+    Function to warm the process up by requesting the departments and teams
+    pages, but the pages warmed by another process. A failed request is
+    logged and skipped, the process is marked warm at the end either way
+    Args:
+        on_step - function without args called after every request, e.g. to
+                  tell the server that the worker is alive
+    Returns:
+        {"requests": 8, "skipped": 0, "errors": 0, "seconds": 3.2}
+    """
+    # Import here, the views import this module
+    from . import views
+
+    global _started
+    with _started_lock:
+        _started = True
+    warmup_settings = get_warmup_settings()
+    started = perf_counter()
+    requests = skipped = errors = 0
+    try:
+        if warmup_settings["ENABLED"]:
+            factory = RequestFactory()
+            pages = [(views.get_departments, DEPARTMENTS_URL, params)
+                     for params in [{}] + list(warmup_settings["FILTERS"])]
+            try:
+                departments = _get_busiest_departments(
+                              warmup_settings["TEAMS_DEPARTMENTS"])
+            except Exception as err:
+                errors += 1
+                departments = []
+                logger.error("Error getting the busiest departments to warm "
+                             "up, Error: %s, Stack: %s"
+                             % (str(err), format_exc()))
+            pages += [(views.get_teams, TEAMS_URL,
+                       {"department_name": name,
+                        "department_id": department_id})
+                      for department_id, name in departments]
+            for page_no, (view, path, params) in enumerate(pages):
+                if page_no and not _claim_page(
+                        path, params, warmup_settings["CLAIM_SECONDS"]):
+                    skipped += 1
+                    continue
+                requests += 1
+                if not _warm_page(factory, view, path, params):
+                    errors += 1
+                if on_step is not None:
+                    on_step()
+    finally:
+        _warm.set()
+    report = {
+        "requests": requests,
+        "skipped": skipped,
+        "errors": errors,
+        "seconds": round(perf_counter() - started, 3),
+    }
+    logger.info("Warm-up done: %s" % str(report))
+    return report
+
+def _warm_up_in_background():
+    """
+    Function run by the warm-up thread
+    """
+    try:
+        warm_up()
+    finally:
+        # The thread owns its own DB connections
+        connections.close_all()
+
+def _warm_page(factory, view, path, params):
+    """
+    Function to request one page
+    Args:
+        factory - RequestFactory
+        view - view function
+        path - request path
+        params - query params
+    Returns:
+        True if the page was served, not the error page
+    """
+    # Import here, the views import this module
+    from .views import ERROR_PAGE_MARKER
+
+    started = perf_counter()
+    try:
+        response = view(factory.get(path, params))
+        if response.streaming:
+            content = b"".join(response.streaming_content)
+        else:
+            content = response.content
+    except Exception as err:
+        logger.error("Error warming up %s %s, Error: %s, Stack: %s"
+                     % (path, str(params), str(err), format_exc()))
+        return False
+    if ERROR_PAGE_MARKER in content:
+        logger.error("Error warming up %s %s, the error page was served"
+                     % (path, str(params)))
+        return False
+    logger.info("Warmed up %s %s in %.2fs, status: %s"
+                % (path, str(params), perf_counter() - started,
+                   response.status_code))
+    return response.status_code < 400
+
+def _claim_page(path, params, claim_seconds):
+    """
+    Function to claim the warm-up of a page for the current process in the
+    shared cache
+    Args:
+        path - request path
+        params - query params
+        claim_seconds - seconds the claim holds, 0 to claim every page
+    Returns:
+        False if another process claimed the page within claim_seconds
+    """
+    if not claim_seconds:
+        return True
+    page = "%s?%s" % (path, urlencode(sorted(params.items())))
+    key = CLAIM_KEY_PREFIX + md5(page.encode("utf-8")).hexdigest()
+    try:
+        return caches[get_cache_settings()["ALIAS"]].add(key, os.getpid(),
+                                                         claim_seconds)
+    except Exception as err:
+        logger.warning("Error claiming the warm-up of %s, Error: %s"
+                       % (page, str(err)))
+        return True
+
+def _get_busiest_departments(limit):
+    """
+    Function to get the departments with the most users over every shard
+    Args:
+        limit - max no of departments
+    Returns:
+        list of (department_id, name)
+    """
+    if not limit:
+        return []
+    counts = [count for shard_counts in scatter(_get_shard_busiest_departments,
+                                                limit)
+              for count in shard_counts]
+    counts.sort(key=lambda count: count[2], reverse=True)
+    return [(department_id, name) for department_id, name, _ in counts[:limit]]
+
+def _get_shard_busiest_departments(using, limit):
+    """
+    Function to get the departments of a shard with the most users
+    Args:
+        using - database alias of the shard
+        limit - max no of departments
+    Returns:
+        list of (department_id, name, users_count)
+    """
+    return list(Users.objects.using(using).filter(
+                team_id__department_id__isnull=False).values_list(
+                "team_id__department_id", "team_id__department_id__name").annotate(
+                users_count=Count("pk")).order_by("-users_count")[:limit])
@@ -0,0 +1,49 @@
+#
+# Copyright (c) 2020. Betterworks, Inc. All Rights Reserved.
+#
+# Author: adithya.bhat@gmail.com (Adithya bhat)
+#
+# Gunicorn configuration of the production server
+#
+# Every worker process warms itself up(see dashboard/warmup.py) before it
+# accepts connections, so /dashboard/ready answers 200 from every worker
+# which is serving. The workers skip the pages another worker warmed, when
+# the cache backend is shared. While a container's workers warm up, connections wait in
+# the listen backlog, give the health check a long enough timeout.
+#
+# Every live updates stream holds one of the worker's threads for as long as
+# its client is connected. The settings cap the streams per worker to half
+# of GUNICORN_THREADS(DASHBOARD_LIVE["MAX_SUBSCRIBERS"]), the other threads
+# keep serving the pages.
+#
+# Environment variables(all optional)
+# PORT - port to listen on, default 8000
+# WEB_CONCURRENCY - no of worker processes, default 2 * CPUs + 1
+# GUNICORN_THREADS - threads per worker, default 16
+# GUNICORN_TIMEOUT - seconds a silent worker is given, default 120
+#
+# Sample usage
+# gunicorn -c gunicorn.conf.py analytical_dashboard.wsgi
+import multiprocessing
+import os
+
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "8000")
+workers = int(os.environ.get("WEB_CONCURRENCY",
+                             multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+accesslog = "-"
+
+def post_worker_init(worker):
+    # Runs in the worker after the application is loaded, before it accepts
+    # connections. Each warmed page counts as a heartbeat, so a long warm-up
+    # isn't mistaken for a stuck worker
+    from dashboard.warmup import warm_up
+
+    report = warm_up(on_step=worker.notify)
+    worker.log.info("Worker %s warmed up with %s requests(%s errors, %s "
+                    "skipped) in %.2fs" % (worker.pid, report["requests"],
+                                           report["errors"], report["skipped"],
+                                           report["seconds"]))